@@ -3,6 +3,15 @@ import asyncio
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
+from src.http_session import create_http_session
+from src.valorant_api import ValorantAPI
+from src.retry_manager import RetryManager
+from src.prefetcher import Prefetcher
+from src.rank_cache import RankCache
+from src.data_manager import DataManager
+from src.storage import create_storage
+from src.utils.leaderboard_renderer import LeaderboardRenderer
+from src.metrics import MetricsServer
 
 # .envファイルを読み込み
 load_dotenv()
@@ -28,9 +37,37 @@ class ValorantBot(commands.Bot):
             intents=intents,
             help_command=None
         )
+        
+        # setup_hookで初期化される共有リソース
+        self.http_session = None
+        self.storage = None
+        self.data_manager = None
+        self.valorant_api = None
+        self.retry_manager = None
+        self.prefetcher = None
+        self.leaderboard_renderer = None
+        self.metrics_server = None
     
     async def setup_hook(self):
         """Bot起動時の初期化処理"""
+        # Bot全体で共有する保存先・HTTPセッション・APIクライアントを作成
+        self.storage = create_storage()
+        self.data_manager = DataManager(self.storage)
+        self.http_session = create_http_session()
+        self.valorant_api = ValorantAPI(
+            os.getenv('VALORANT_API_KEY'),
+            session=self.http_session,
+            cache=RankCache(self.storage)
+        )
+        self.retry_manager = RetryManager(self.valorant_api)
+        # /leaderboardと自動更新で共有する描画キャッシュ
+        self.leaderboard_renderer = LeaderboardRenderer()
+        await self.retry_manager.start()
+        # キャッシュ切れ前の先読みを開始
+        self.prefetcher = Prefetcher(self.valorant_api, self.data_manager)
+        if os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true':
+            self.prefetcher.start()
+        
         print("Loading commands...")
         
         # コマンドを読み込み
@@ -53,6 +90,33 @@ class ValorantBot(commands.Bot):
         else:
             await self.tree.sync()
             print("Slash commands synced globally")
+        
+        # 稼働状況を/metricsで公開（ローカルのみ）
+        if os.getenv('METRICS_ENABLED', 'true').lower() == 'true':
+            self.metrics_server = MetricsServer(
+                self,
+                host=os.getenv('METRICS_HOST', '127.0.0.1'),
+                port=int(os.getenv('METRICS_PORT', '9108'))
+            )
+            await self.metrics_server.start()
+    
+    async def close(self):
+        """Bot終了時に共有リソースを解放"""
+        if self.metrics_server:
+            await self.metrics_server.stop()
+        if self.prefetcher:
+            self.prefetcher.stop()
+        if self.retry_manager:
+            await self.retry_manager.stop_all()
+        
+        await super().close()
+        
+        if self.valorant_api:
+            await self.valorant_api.cache.close()
+        if self.storage:
+            await self.storage.close()
+        if self.http_session and not self.http_session.closed:
+            await self.http_session.close()
     
     async def on_ready(self):
         """Bot準備完了時"""
@@ -63,11 +127,10 @@ class ValorantBot(commands.Bot):
         activity = discord.Game(name="Valorant Rankings")
         await self.change_presence(activity=activity)
         
-        # 自動更新タスクを開始
-        from src.commands.auto_update import AutoUpdate
+        # 自動更新スケジューラを開始
         auto_update_cog = self.get_cog('AutoUpdate')
-        if auto_update_cog and not auto_update_cog.auto_leaderboard_update.is_running():
-            auto_update_cog.auto_leaderboard_update.start()
+        if auto_update_cog and not auto_update_cog.scheduler.is_running():
+            auto_update_cog.scheduler.start()
 
 async def main():
     """メイン関数"""
@@ -0,0 +1,122 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+class AdaptiveConcurrencyLimiter:
+    """APIの応答状況に合わせて同時実行数を調整するリミッター（AIMD）
+
+    応答が正常で窓を使い切っている間は窓を少しずつ広げ（加算的増加）、
+    429・5xx・タイムアウトを受けたら窓を一定の割合で狭める（乗算的減少）。
+    レイテンシが平常時の値よりlatency_tolerance倍以上遅い間は窓を広げない。
+    空いた枠は優先度（RateLimiterのPriority）の高い順、同じ優先度なら到着順に割り当てる。
+    """
+
+    def __init__(self, initial: int = 3, min_limit: int = 1, max_limit: int = 20,
+                 backoff: float = 0.5, latency_tolerance: float = 2.0, decrease_cooldown: float = 1.0):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.backoff = backoff  # 減少時に窓に掛ける係数
+        self.latency_tolerance = latency_tolerance  # 平常時の何倍遅ければ混雑とみなすか
+        self.decrease_cooldown = decrease_cooldown  # 同時に失敗した分で何度も狭めないための間隔（秒）
+        self.window = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (優先度, 到着順, future)のヒープ
+        self._seq = itertools.count()
+        self._latency_ewma: Optional[float] = None  # 直近のレイテンシ（指数移動平均）
+        self._baseline: Optional[float] = None  # 平常時のレイテンシ（最小値をゆっくり追従）
+        self._last_decrease = 0.0
+
+        # 統計情報
+        self.decisions = {"increase": 0, "hold": 0, "decrease": 0}
+
+    @property
+    def limit(self) -> int:
+        """現在の同時実行数の上限"""
+        return max(self.min_limit, int(self.window))
+
+    async def acquire(self, priority: int = 0):
+        """実行枠が空くまで待つ（priorityが小さいほど先、同じなら到着順）"""
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), future))
+        self._wake()  # 先頭に残っていたのがキャンセル済みの待機者だけなら、すぐに枠を受け取れる
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 割り当てられた枠は使わずに返す
+                self.release()
+            # 待機列に残ったキャンセル済みのfutureは_wakeで取り除く
+            raise
+
+    def release(self):
+        """実行枠を返す"""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        """空いた枠を待機中のタスクに割り当てる"""
+        while self._waiters and self.in_flight < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0) -> AsyncIterator[None]:
+        """実行枠を取得して処理が終わったら返す"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_success(self, latency: float):
+        """正常な応答とそのレイテンシ（秒）を記録して窓を調整"""
+        if self._latency_ewma is None:
+            self._latency_ewma = self._baseline = latency
+        else:
+            self._latency_ewma += (latency - self._latency_ewma) * 0.2
+            # 平常時の値は最小値に寄せつつ、APIの性能変化にはゆっくり追従する
+            self._baseline = min(latency, self._baseline + (latency - self._baseline) * 0.01)
+
+        congested = self._latency_ewma > self._baseline * self.latency_tolerance
+        # 窓を使い切っていない間は広げても意味がないので広げない
+        if congested or self.in_flight < self.limit or self.window >= self.max_limit:
+            self.decisions["hold"] += 1
+            return
+
+        self.window = min(float(self.max_limit), self.window + 1 / self.window)
+        self.decisions["increase"] += 1
+        self._wake()
+
+    def record_failure(self):
+        """429・5xx・タイムアウトを記録して窓を狭める"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        previous_limit = self.limit
+        self.window = max(float(self.min_limit), self.window * self.backoff)
+        self.decisions["decrease"] += 1
+        if self.limit < previous_limit:
+            print(f"API throttling detected, concurrency window reduced to {self.limit}")
+
+    def get_stats(self) -> Dict:
+        """同時実行数の窓と調整の統計情報を取得"""
+        return {
+            "window": round(self.window, 2),
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": sum(1 for _, _, future in self._waiters if not future.done()),
+            "latency_ewma": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+            "latency_baseline": round(self._baseline, 3) if self._baseline is not None else None,
+            "decisions": dict(self.decisions)
+        }
@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import time
+import zlib
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from .metrics import Histogram
+
+class AutoUpdateScheduler:
+    """ギルドごとの自動更新を間隔内に分散して実行するスケジューラ
+
+    各ギルドにはギルドIDから決まる位相（更新間隔内のオフセット）を割り当て、
+    全ギルドが同じ瞬間に更新されないようにする。更新は並列数を制限して実行し、
+    遅いギルドが他のギルドの更新を遅らせないようにする。
+    """
+
+    def __init__(self,
+                 load_configs: Callable[[], Awaitable[Dict[str, Dict]]],
+                 refresh_guild: Callable[[str, Dict], Awaitable[None]],
+                 default_interval_minutes: float = 5,
+                 max_concurrency: int = 3,
+                 reload_interval: float = 60):
+        self.load_configs = load_configs
+        self.refresh_guild = refresh_guild
+        self.default_interval_minutes = default_interval_minutes
+        self.reload_interval = reload_interval  # 設定を読み直す間隔（秒）
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._configs: Dict[str, Dict] = {}
+        self._next_run: Dict[str, float] = {}  # guild_id -> 次回実行時刻
+        self._heap: List[Tuple[float, str]] = []
+        self._running: Dict[str, asyncio.Task] = {}  # 実行中の更新タスク
+        self._wakeup = asyncio.Event()
+        self._reload_requested = True
+        self._last_reload = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        # 統計情報
+        self.durations = Histogram((1, 5, 10, 30, 60, 120, 300, 600))  # 1回の更新にかかった秒数
+        self.last_durations: Dict[str, float] = {}  # guild_id -> 直近の更新にかかった秒数
+
+    def get_interval(self, config: Dict) -> float:
+        """ギルドの更新間隔（秒）を取得"""
+        return float(config.get("interval_minutes") or self.default_interval_minutes) * 60
+
+    def get_phase(self, guild_id: str, interval: float) -> float:
+        """ギルドIDから更新間隔内の位相（秒）を求める"""
+        return (zlib.crc32(guild_id.encode()) % 10000) / 10000 * interval
+
+    def _next_slot(self, guild_id: str, interval: float, after: float) -> float:
+        """afterより後で、そのギルドの位相に一致する次の実行時刻を求める"""
+        phase = self.get_phase(guild_id, interval)
+        slot = (after - phase) // interval * interval + phase
+        while slot <= after:
+            slot += interval
+        return slot
+
+    def is_running(self) -> bool:
+        """スケジューラが動作中か"""
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """スケジューラを開始"""
+        if not self.is_running():
+            self._reload_requested = True
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """スケジューラと実行中の更新を停止"""
+        if self._task:
+            self._task.cancel()
+        for task in self._running.values():
+            task.cancel()
+        self._running.clear()
+
+    def notify_config_changed(self):
+        """設定変更を通知して次のループで読み直させる"""
+        self._reload_requested = True
+        self._wakeup.set()
+
+    async def _reload(self):
+        """設定を読み直してスケジュールを更新"""
+        configs = await self.load_configs()
+        now = time.time()
+        self._configs = {
+            guild_id: config for guild_id, config in configs.items()
+            if config.get("enabled") and config.get("message_id") and config.get("channel_id")
+        }
+
+        for guild_id, config in self._configs.items():
+            interval = self.get_interval(config)
+            next_run = self._next_run.get(guild_id)
+            # 新規ギルドまたは間隔が変わったギルドは位相に合わせて再スケジュール
+            if next_run is None or next_run - now > interval:
+                next_run = self._next_slot(guild_id, interval, now)
+                self._next_run[guild_id] = next_run
+                heapq.heappush(self._heap, (next_run, guild_id))
+
+        # 無効化されたギルドを削除（ヒープ内の古いエントリは取り出し時に無視する）
+        for guild_id in list(self._next_run):
+            if guild_id not in self._configs:
+                del self._next_run[guild_id]
+                self.last_durations.pop(guild_id, None)
+
+        self._reload_requested = False
+        self._last_reload = now
+
+    async def _run(self):
+        """メインループ: 次に実行すべきギルドの時刻まで待機して更新を起動"""
+        while True:
+            try:
+                self._wakeup.clear()
+                now = time.time()
+                if self._reload_requested or now - self._last_reload >= self.reload_interval:
+                    await self._reload()
+                    now = time.time()
+
+                # 実行時刻になったギルドの更新を起動
+                while self._heap and self._heap[0][0] <= now:
+                    run_at, guild_id = heapq.heappop(self._heap)
+                    if self._next_run.get(guild_id) != run_at:
+                        continue  # 無効化・再スケジュール済みのエントリ
+
+                    config = self._configs[guild_id]
+                    next_run = self._next_slot(guild_id, self.get_interval(config), now)
+                    self._next_run[guild_id] = next_run
+                    heapq.heappush(self._heap, (next_run, guild_id))
+
+                    if guild_id in self._running:
+                        print(f"Auto-update for guild {guild_id} is still running, skipping this slot")
+                        continue
+                    self._running[guild_id] = asyncio.create_task(self._refresh(guild_id, config))
+
+                # 次の実行時刻か設定の再読み込み時刻まで待機
+                wait = self._last_reload + self.reload_interval - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, wait))
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Auto-update scheduler error: {e}")
+                await asyncio.sleep(5)
+
+    async def _refresh(self, guild_id: str, config: Dict):
+        """並列数を制限してギルドの更新を実行"""
+        try:
+            async with self._semaphore:
+                started_at = time.monotonic()
+                await self.refresh_guild(guild_id, config)
+                duration = time.monotonic() - started_at
+                self.durations.observe(duration)
+                self.last_durations[guild_id] = duration
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Auto-update error for guild {guild_id}: {e}")
+        finally:
+            self._running.pop(guild_id, None)
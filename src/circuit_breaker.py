@@ -0,0 +1,75 @@
+import time
+from typing import Dict
+
+class CircuitOpenError(RuntimeError):
+    """サーキットブレーカーが開いているためリクエストを送らなかった"""
+
+class CircuitBreaker:
+    """API障害時にリクエストを止めるサーキットブレーカー
+
+    5xx・タイムアウトが連続したら開いて（open）リクエストを即座に失敗させ、
+    一定時間後に1件だけ試験的に通す（half-open）。試験が成功すれば閉じ、
+    失敗すれば再び開く。
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30):
+        self.failure_threshold = failure_threshold  # 開くまでの連続失敗回数
+        self.recovery_timeout = recovery_timeout  # 開いてから試験リクエストを通すまでの秒数
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at = None  # 実行中の試験リクエストの開始時刻
+
+        # 統計情報
+        self.trip_count = 0  # 開いた回数
+        self.rejected_count = 0  # 開いている間に止めたリクエスト数
+
+    def allow_request(self) -> bool:
+        """リクエストを送ってよいか（half-openでは試験リクエストを1件だけ通す）"""
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_started_at = None
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.HALF_OPEN:
+            # 試験リクエストが応答しないまま時間が経った場合は次の試験を通す
+            if self._probe_started_at is None or now - self._probe_started_at >= self.recovery_timeout:
+                self._probe_started_at = now
+                return True
+
+        self.rejected_count += 1
+        return False
+
+    def record_success(self):
+        """リクエストの成功（サーバーが応答した）を記録"""
+        if self.state != self.CLOSED:
+            print("Circuit breaker closed: API recovered")
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_started_at = None
+
+    def record_failure(self):
+        """5xx・タイムアウトを記録し、続いていればブレーカーを開く"""
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trip_count += 1
+                print(f"Circuit breaker opened after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_started_at = None
+
+    def get_stats(self) -> Dict:
+        """ブレーカーの状態と統計情報を取得"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "trips": self.trip_count,
+            "rejected": self.rejected_count
+        }
@@ -1,33 +1,49 @@
 import discord
-from discord.ext import commands, tasks
+from discord.ext import commands
 from discord import app_commands
 import os
-from ..valorant_api import ValorantAPI
-from ..data_manager import DataManager
-from ..utils.ui_helpers import UIHelpers
-from ..retry_manager import RetryManager
+import json
+import time
+import hashlib
+from typing import Dict, Tuple
+from ..auto_update_scheduler import AutoUpdateScheduler
+from ..rate_limiter import Priority
 
 class AutoUpdate(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.data_manager = DataManager()
-        self.retry_manager = RetryManager(os.getenv('VALORANT_API_KEY'))
+        self.data_manager = bot.data_manager
+        self.retry_manager = bot.retry_manager
+        self.renderer = bot.leaderboard_renderer
+        # ギルドごとに位相をずらして自動更新を実行するスケジューラ
+        self.scheduler = AutoUpdateScheduler(
+            self.data_manager.get_enabled_auto_update_configs,
+            self.update_guild_leaderboard,
+            default_interval_minutes=float(os.getenv('AUTO_UPDATE_INTERVAL_MINUTES', '5')),
+            max_concurrency=int(os.getenv('AUTO_UPDATE_CONCURRENCY', '3'))
+        )
+        # 内容が変わっていなくても強制的に編集する間隔（タイムスタンプが古くなりすぎないように）
+        self.force_refresh_interval = float(os.getenv('AUTO_UPDATE_FORCE_REFRESH_MINUTES', '30')) * 60
+        self._fingerprints: Dict[int, Tuple[str, float]] = {}  # message_id -> (Embedのハッシュ, 最終編集時刻)
+        self.edit_stats = {"edits": 0, "edits_skipped": 0}
         
     def cog_unload(self):
         """Cogがアンロードされる時にタスクを停止"""
-        self.auto_leaderboard_update.cancel()
+        self.scheduler.stop()
     
-    @app_commands.command(name="auto-leaderboard", description="5分間隔でリーダーボードの自動更新を設定")
+    @app_commands.command(name="auto-leaderboard", description="一定間隔でリーダーボードの自動更新を設定（デフォルト: 5分）")
     @app_commands.describe(
         message_id="更新するメッセージのID（まず/leaderboardでメッセージを作成してIDを取得）",
-        enable="自動更新を有効/無効にする"
+        enable="自動更新を有効/無効にする",
+        interval="更新間隔（分）"
     )
     @app_commands.choices(enable=[
         app_commands.Choice(name="有効にする", value="true"),
         app_commands.Choice(name="無効にする", value="false")
     ])
     async def auto_leaderboard(self, interaction: discord.Interaction, 
-                             message_id: str, enable: str = "true"):
+                             message_id: str, enable: str = "true",
+                             interval: app_commands.Range[int, 1, 60] = 5):
         
         
         await interaction.response.defer(ephemeral=True)
@@ -59,16 +75,17 @@ class AutoUpdate(commands.Cog):
                     "enabled": True,
                     "message_id": message_id_int,
                     "channel_id": interaction.channel_id,
-                    "region": "ap"
+                    "region": "ap",
+                    "interval_minutes": interval
                 })
                 
-                # タスクを開始（まだ開始されていない場合）
-                if not self.auto_leaderboard_update.is_running():
-                    self.auto_leaderboard_update.start()
+                # スケジューラを開始（まだ開始されていない場合）し、設定変更を反映
+                self.scheduler.start()
+                self.scheduler.notify_config_changed()
                 
                 embed = discord.Embed(
                     title="✅ 自動更新設定完了",
-                    description=f"メッセージID `{message_id}` が5分間隔で自動更新されます。",
+                    description=f"メッセージID `{message_id}` が{interval}分間隔で自動更新されます。",
                     color=0x00FF00,
                     timestamp=discord.utils.utcnow()
                 )
@@ -81,6 +98,7 @@ class AutoUpdate(commands.Cog):
                     "channel_id": None,
                     "region": "ap"
                 })
+                self.scheduler.notify_config_changed()
                 
                 embed = discord.Embed(
                     title="🛑 自動更新停止",
@@ -95,177 +113,82 @@ class AutoUpdate(commands.Cog):
             print(f"Auto-update configuration error: {e}")
             await interaction.followup.send("設定中にエラーが発生しました。")
     
-    @tasks.loop(minutes=5)
-    async def auto_leaderboard_update(self):
-        """5分間隔でリーダーボードを更新"""
-        try:
-            # 自動更新が有効なすべてのギルドを取得
-            configs = await self.data_manager.get_all_auto_update_configs()
-            
-            for guild_id, config in configs.items():
-                if not config.get("enabled"):
-                    continue
-                
-                message_id = config.get("message_id")
-                channel_id = config.get("channel_id")
-                region = config.get("region", "ap")
-                
-                if not message_id or not channel_id:
-                    continue
-                
-                try:
-                    # チャンネルとメッセージを取得
-                    channel = self.bot.get_channel(channel_id)
-                    if not channel:
-                        print(f"Channel {channel_id} not found for guild {guild_id}")
-                        continue
-                    
-                    try:
-                        message = await channel.fetch_message(message_id)
-                    except discord.NotFound:
-                        print(f"Message {message_id} not found in guild {guild_id}")
-                        # メッセージが見つからない場合は自動更新を無効化
-                        await self.data_manager.store_auto_update_config(guild_id, {
-                            "enabled": False,
-                            "message_id": None,
-                            "channel_id": None,
-                            "region": region
-                        })
-                        continue
-                    
-                    # プレイヤーデータを取得
-                    registered_players = await self.data_manager.get_guild_players(guild_id)
-                    if not registered_players:
-                        # プレイヤーがいない場合はメッセージに表示
-                        embed = discord.Embed(
-                            title=f"🏆 Valorant Leaderboard ({region.upper()}) - 自動更新",
-                            description="登録されたプレイヤーがいません。",
-                            color=0xFA4454,
-                            timestamp=discord.utils.utcnow()
-                        )
-                        await message.edit(embed=embed)
-                        continue
-                    
-                    # リーダーボードを生成（キャッシュ付き）
-                    valorant_api = ValorantAPI(os.getenv('VALORANT_API_KEY'))
-                    player_list = [{"name": p["name"], "tag": p["tag"]} for p in registered_players]
-                    leaderboard_data, failed_players = await valorant_api.get_leaderboard_data(
-                        region, player_list, guild_id
-                    )
-                    sorted_data = valorant_api.sort_by_rank(leaderboard_data)
-                    
-                    # 失敗したプレイヤーがいる場合、再試行をスケジュール
-                    if failed_players:
-                        await self.retry_manager.immediate_retry(guild_id, failed_players)
-                        print(f"Auto-update: Scheduled retry for {len(failed_players)} players in guild {guild_id}")
-                    
-                    # Embedを作成して既存メッセージを完全上書き
-                    embed = self.create_auto_leaderboard_embed(sorted_data, region, len(registered_players))
-                    await message.edit(content="", embed=embed, attachments=[])
-                    
-                except Exception as e:
-                    print(f"Auto-update error for guild {guild_id}: {e}")
-                    continue
-                    
-        except Exception as e:
-            print(f"Auto-update task error: {e}")
-    
-    @auto_leaderboard_update.before_loop
-    async def before_auto_update(self):
-        """タスク開始前にボットの準備を待つ"""
-        await self.bot.wait_until_ready()
-    
-    def create_auto_leaderboard_embed(self, sorted_data: list, region: str, total_players: int) -> discord.Embed:
-        """自動更新用のかっこいいLeaderboard Embedを作成"""
-        # 紫色を使用
-        embed_color = 0x8A2BE2
-        
-        embed = discord.Embed(
-            title=UIHelpers.create_leaderboard_title(region, is_auto=True),
-            color=embed_color,
-            timestamp=discord.utils.utcnow()
-        )
+    async def update_guild_leaderboard(self, guild_id: str, config: Dict):
+        """ギルドのリーダーボードメッセージを更新"""
+        message_id = config.get("message_id")
+        channel_id = config.get("channel_id")
+        region = config.get("region", "ap")
         
-        if not sorted_data:
-            embed.description = "🚫 データを取得できたプレイヤーがいませんでした\n🔄 次回更新: 5分後"
-            return embed
+        # fetch_messageを使わず、保存済みのIDから部分メッセージを作成して直接編集する
+        channel = self.bot.get_channel(channel_id) or self.bot.get_partial_messageable(channel_id)
+        message = channel.get_partial_message(message_id)
         
-        description = ""
-        display_limit = min(len(sorted_data), 20)
-        
-        for i in range(display_limit):
-            player = sorted_data[i]
-            current = player.get("current", {})
-            tier = current.get("tier", {})
-            rank = tier.get("name", "Unrated")
-            rr = current.get("rr", 0)
-            
-            position_emoji = UIHelpers.get_position_emoji(i + 1)
-            rank_emoji = UIHelpers.get_rank_emoji(rank)
-            
-            # プレイヤー情報（強調表示）
-            player_name = f"**{player['name']}#{player['tag']}**"
-            
-            # ランク名を日本語化
-            rank_jp = {
-                "Radiant": "レディアント",
-                "Immortal 3": "イモータル 3", 
-                "Immortal 2": "イモータル 2",
-                "Immortal 1": "イモータル 1",
-                "Ascendant 3": "アセンダント 3",
-                "Ascendant 2": "アセンダント 2", 
-                "Ascendant 1": "アセンダント 1",
-                "Diamond 3": "ダイヤモンド 3",
-                "Diamond 2": "ダイヤモンド 2",
-                "Diamond 1": "ダイヤモンド 1",
-                "Platinum 3": "プラチナ 3",
-                "Platinum 2": "プラチナ 2",
-                "Platinum 1": "プラチナ 1",
-                "Gold 3": "ゴールド 3",
-                "Gold 2": "ゴールド 2", 
-                "Gold 1": "ゴールド 1",
-                "Silver 3": "シルバー 3",
-                "Silver 2": "シルバー 2",
-                "Silver 1": "シルバー 1",
-                "Bronze 3": "ブロンズ 3",
-                "Bronze 2": "ブロンズ 2",
-                "Bronze 1": "ブロンズ 1",
-                "Iron 3": "アイアン 3",
-                "Iron 2": "アイアン 2",
-                "Iron 1": "アイアン 1"
-            }.get(rank, rank)
-            
-            # リスト形式で表示
-            if i == 0:
-                description += f"🏅 1位: {player_name}\n"
-            elif i == 1:
-                description += f"🥈 2位: {player_name}\n"
-            elif i == 2:
-                description += f"🥉 3位: {player_name}\n"
-            else:
-                description += f"{i+1}位: {player_name}\n"
+        # プレイヤーデータを取得
+        registered_players = await self.data_manager.get_guild_players(guild_id)
+        if not registered_players:
+            # プレイヤーがいない場合はメッセージに表示
+            embed = discord.Embed(
+                title=f"🏆 Valorant Leaderboard ({region.upper()}) - 自動更新",
+                description="登録されたプレイヤーがいません。",
+                color=0xFA4454,
+                timestamp=discord.utils.utcnow()
+            )
+        else:
+            # リーダーボードを生成（キャッシュ付き）
+            valorant_api = self.bot.valorant_api
+            player_list = [
+                {"name": p["name"], "tag": p["tag"], "puuid": p.get("puuid"), "region": p.get("region")}
+                for p in registered_players
+            ]
+            ranking, failed_players = await valorant_api.get_guild_ranking(
+                guild_id, region, player_list, priority=Priority.AUTO_UPDATE
+            )
             
-            description += f"{rank_emoji} {rank_jp} | {rr} RR\n"
+            # 失敗したプレイヤーがいる場合、再試行をスケジュール
+            if failed_players:
+                await self.retry_manager.schedule(guild_id, failed_players)
+                print(f"Auto-update: Scheduled retry for {len(failed_players)} players in guild {guild_id}")
             
-            # プレイヤー間に余白を追加
-            if i < display_limit - 1:
-                description += "\n"
+            # Embedを作成して既存メッセージを完全上書き
+            embed = self.renderer.create_embed(
+                guild_id, ranking, region, len(registered_players), is_auto=True,
+                interval_minutes=self.scheduler.get_interval(config) / 60
+            )
         
-        # 最下位の下に余白追加
-        description += "\n"
-        
-        # 追加統計情報
-        if len(sorted_data) > 20:
-            description += f"\n🔽 **他 {len(sorted_data) - 20} 名のプレイヤー**"
-        
-        embed.description = description
+        try:
+            await self._edit_if_changed(message, embed)
+        except discord.NotFound:
+            print(f"Message {message_id} not found in guild {guild_id}")
+            self._fingerprints.pop(message_id, None)
+            # メッセージが見つからない場合は自動更新を無効化
+            await self.data_manager.store_auto_update_config(guild_id, {
+                "enabled": False,
+                "message_id": None,
+                "channel_id": None,
+                "region": region
+            })
+            self.scheduler.notify_config_changed()
+    
+    def _fingerprint(self, embed: discord.Embed) -> str:
+        """タイムスタンプを除いたEmbedの内容からハッシュを作成"""
+        payload = embed.to_dict()
+        payload.pop("timestamp", None)
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+    
+    async def _edit_if_changed(self, message: discord.PartialMessage, embed: discord.Embed) -> bool:
+        """内容が前回から変わった場合のみメッセージを編集（一定間隔で強制更新）"""
+        fingerprint = self._fingerprint(embed)
+        now = time.monotonic()
+        previous = self._fingerprints.get(message.id)
         
-        # フッターに詳細情報（日本語）
-        embed.set_footer(
-            text=f"🔄 自動更新中 • {len(sorted_data)}/{total_players} 名表示"
-        )
+        if previous and previous[0] == fingerprint and now - previous[1] < self.force_refresh_interval:
+            self.edit_stats["edits_skipped"] += 1
+            return False
         
-        return embed
+        await message.edit(content="", embed=embed, attachments=[])
+        self._fingerprints[message.id] = (fingerprint, now)
+        self.edit_stats["edits"] += 1
+        return True
 
 async def setup(bot):
     await bot.add_cog(AutoUpdate(bot))
\ No newline at end of file
@@ -1,16 +1,21 @@
+import asyncio
+import os
+import time
 import discord
 from discord.ext import commands
 from discord import app_commands
-import os
-from ..valorant_api import ValorantAPI
-from ..data_manager import DataManager
-from ..utils.ui_helpers import UIHelpers
-from ..retry_manager import RetryManager
+from ..guild_ranking import GuildRanking
+from ..rate_limiter import Priority
 
 class Leaderboard(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.retry_manager = RetryManager(os.getenv('VALORANT_API_KEY'))
+        self.retry_manager = bot.retry_manager
+        self.renderer = bot.leaderboard_renderer
+        self._revalidate_tasks = set()  # バックグラウンド更新中のタスク
+        # 取得途中のLeaderboardを編集する最短間隔（秒）
+        self.progress_interval = float(os.getenv('LEADERBOARD_PROGRESS_INTERVAL', '2'))
+        self.edit_stats = {"edits": 0}
     
     @app_commands.command(name="leaderboard", description="ValorantランキングでサーバーLeaderboardを表示 (デフォルト: AP)")
     @app_commands.describe(
@@ -33,8 +38,8 @@ class Leaderboard(commands.Cog):
         await self.cleanup_old_leaderboards(interaction.channel)
         
         try:
-            valorant_api = ValorantAPI(os.getenv('VALORANT_API_KEY'))
-            data_manager = DataManager()
+            valorant_api = self.bot.valorant_api
+            data_manager = self.bot.data_manager
             
             # 登録されたプレイヤーを取得
             registered_players = await data_manager.get_guild_players(str(interaction.guild_id))
@@ -46,22 +51,74 @@ class Leaderboard(commands.Cog):
                 return
             
             # プレイヤーリストを準備
-            player_list = [{"name": p["name"], "tag": p["tag"]} for p in registered_players]
+            player_list = [
+                {"name": p["name"], "tag": p["tag"], "puuid": p.get("puuid"), "region": p.get("region")}
+                for p in registered_players
+            ]
             
-            # Leaderboardデータを取得（キャッシュ付き）
-            leaderboard_data, failed_players = await valorant_api.get_leaderboard_data(
-                region, player_list, str(interaction.guild_id)
-            )
-            sorted_data = valorant_api.sort_by_rank(leaderboard_data)
+            # まずキャッシュだけで組み立てたLeaderboardをすぐに表示する
+            guild_id = str(interaction.guild_id)
+            player_keys = [valorant_api.cache.player_key(p) for p in player_list]
+            stale_players = []
+            results, pending = await valorant_api.get_cached_leaderboard_data(player_list, revalidate=stale_players)
+            ranking = valorant_api.rankings.sync_guild(guild_id, player_keys, {
+                player_key: data for player_key, data in zip(player_keys, results) if data is not None
+            })
+            message = None
+            if pending:
+                embed = self.renderer.create_embed(
+                    guild_id, ranking, region, len(registered_players),
+                    stale_age=self.get_stale_age(ranking, stale_players), pending=len(pending)
+                )
+                message = await interaction.followup.send(embed=embed, wait=True)
+            
+            # APIから取得できた順に順位表へ反映し、間隔を空けて途中経過を表示する
+            remaining = len(pending)
+            last_edit = time.monotonic()
+            stream = valorant_api.iter_leaderboard_data(region, player_list, pending)
+            try:
+                async for i, data in stream:
+                    results[i] = data
+                    if data is not None:
+                        ranking.update(player_keys[i], data)
+                    remaining -= 1
+                    if remaining == 0 or time.monotonic() - last_edit < self.progress_interval:
+                        continue  # 最終結果は下でまとめて表示
+                    
+                    embed = self.renderer.create_embed(
+                        guild_id, ranking, region, len(registered_players),
+                        stale_age=self.get_stale_age(ranking, stale_players), pending=remaining
+                    )
+                    await message.edit(embed=embed)
+                    self.edit_stats["edits"] += 1
+                    last_edit = time.monotonic()
+            finally:
+                # 編集の失敗などで途中で抜けても、取得中のタスクを確実に片付ける
+                await stream.aclose()
+            
+            failed_players = [player for player, data in zip(player_list, results) if data is None]
             
             # 失敗したプレイヤーがいる場合、再試行をスケジュール
             if failed_players:
-                await self.retry_manager.immediate_retry(str(interaction.guild_id), failed_players)
+                await self.retry_manager.schedule(guild_id, failed_players)
                 print(f"Scheduled retry for {len(failed_players)} players")
             
-            # Embedを作成
-            embed = self.create_leaderboard_embed(sorted_data, region, len(registered_players))
-            await interaction.followup.send(embed=embed)
+            # 最終結果を表示
+            stale_age = self.get_stale_age(ranking, stale_players)
+            embed = self.renderer.create_embed(guild_id, ranking, region, len(registered_players), stale_age=stale_age)
+            if message is None:
+                message = await interaction.followup.send(embed=embed, wait=True)
+            else:
+                await message.edit(embed=embed)
+                self.edit_stats["edits"] += 1
+            
+            # 古いデータを表示した場合はバックグラウンドで更新してメッセージを編集
+            if stale_players:
+                task = asyncio.create_task(self.revalidate_leaderboard(
+                    message, region, len(player_list), stale_players, guild_id
+                ))
+                self._revalidate_tasks.add(task)
+                task.add_done_callback(self._revalidate_tasks.discard)
             
         except Exception as e:
             print(f"Leaderboard command error: {e}")
@@ -69,98 +126,35 @@ class Leaderboard(commands.Cog):
                 "Leaderboard取得中にエラーが発生しました。後でもう一度お試しください。"
             )
     
-    def create_leaderboard_embed(self, sorted_data: list, region: str, total_players: int) -> discord.Embed:
-        """かっこいいLeaderboard用のEmbedを作成"""
-        # 紫色を使用
-        embed_color = 0x8A2BE2
-        
-        embed = discord.Embed(
-            title=UIHelpers.create_leaderboard_title(region),
-            color=embed_color,
-            timestamp=discord.utils.utcnow()
-        )
-        
-        
-        if not sorted_data:
-            embed.description = "🚫 データを取得できたプレイヤーがいませんでした\n💡 API制限またはサーバーエラーの可能性があります"
-            return embed
-        
-        description = ""
-        display_limit = min(len(sorted_data), 20)
-        
-        for i in range(display_limit):
-            player = sorted_data[i]
-            current = player.get("current", {})
-            tier = current.get("tier", {})
-            rank = tier.get("name", "Unrated")
-            rr = current.get("rr", 0)
-            
-            position_emoji = UIHelpers.get_position_emoji(i + 1)
-            rank_emoji = UIHelpers.get_rank_emoji(rank)
-            
-            # プレイヤー情報（強調表示）
-            player_name = f"**{player['name']}#{player['tag']}**"
-            
-            # ランク名を日本語化
-            rank_jp = {
-                "Radiant": "レディアント",
-                "Immortal 3": "イモータル 3", 
-                "Immortal 2": "イモータル 2",
-                "Immortal 1": "イモータル 1",
-                "Ascendant 3": "アセンダント 3",
-                "Ascendant 2": "アセンダント 2", 
-                "Ascendant 1": "アセンダント 1",
-                "Diamond 3": "ダイヤモンド 3",
-                "Diamond 2": "ダイヤモンド 2",
-                "Diamond 1": "ダイヤモンド 1",
-                "Platinum 3": "プラチナ 3",
-                "Platinum 2": "プラチナ 2",
-                "Platinum 1": "プラチナ 1",
-                "Gold 3": "ゴールド 3",
-                "Gold 2": "ゴールド 2", 
-                "Gold 1": "ゴールド 1",
-                "Silver 3": "シルバー 3",
-                "Silver 2": "シルバー 2",
-                "Silver 1": "シルバー 1",
-                "Bronze 3": "ブロンズ 3",
-                "Bronze 2": "ブロンズ 2",
-                "Bronze 1": "ブロンズ 1",
-                "Iron 3": "アイアン 3",
-                "Iron 2": "アイアン 2",
-                "Iron 1": "アイアン 1"
-            }.get(rank, rank)
-            
-            # リスト形式で表示
-            if i == 0:
-                description += f"🏅 1位: {player_name}\n"
-            elif i == 1:
-                description += f"🥈 2位: {player_name}\n"
-            elif i == 2:
-                description += f"🥉 3位: {player_name}\n"
-            else:
-                description += f"{i+1}位: {player_name}\n"
+    def get_stale_age(self, ranking: GuildRanking, stale_players: list) -> float:
+        """表示中の古いデータのうち最も古いものの経過秒数を取得（古いデータがなければNone）"""
+        if not stale_players:
+            return None
+        cache = self.bot.valorant_api.cache
+        return max((cache.get_data_age(snapshot) for snapshot in ranking.snapshots()), default=0.0)
+    
+    async def revalidate_leaderboard(self, message: discord.Message, region: str, total_players: int,
+                                     stale_players: list, guild_id: str):
+        """古いデータのプレイヤーを取得し直し、最新のLeaderboardでメッセージを編集"""
+        try:
+            valorant_api = self.bot.valorant_api
+            # 取得できた分はキャッシュ経由で順位表に反映される（失敗した分は古いデータのまま表示）
+            failed_players = await valorant_api.refresh_players(stale_players, region, Priority.LEADERBOARD)
+            ranking = valorant_api.rankings.get(guild_id)
             
-            description += f"{rank_emoji} {rank_jp} | {rr} RR\n"
+            if failed_players:
+                await self.retry_manager.schedule(guild_id, failed_players)
+                print(f"Scheduled retry for {len(failed_players)} players")
             
-            # プレイヤー間に余白を追加
-            if i < display_limit - 1:
-                description += "\n"
-        
-        # 最下位の下に余白追加
-        description += "\n"
-        
-        # 追加統計情報
-        if len(sorted_data) > 20:
-            description += f"\n🔽 **他 {len(sorted_data) - 20} 名のプレイヤー**"
-        
-        embed.description = description
-        
-        # フッターに詳細情報（日本語）
-        embed.set_footer(
-            text=f"⚡ {len(sorted_data)}/{total_players} 名表示 • 🔄 最終更新: たった今"
-        )
-        
-        return embed
+            embed = self.renderer.create_embed(
+                guild_id, ranking, region, total_players, stale_age=self.get_stale_age(ranking, failed_players)
+            )
+            await message.edit(embed=embed)
+            self.edit_stats["edits"] += 1
+        except discord.NotFound:
+            pass  # 更新前にメッセージが削除された
+        except Exception as e:
+            print(f"Leaderboard revalidation error: {e}")
     
     async def cleanup_old_leaderboards(self, channel):
         """チャンネル内の古いリーダーボードを削除（2個以上ある場合）"""
@@ -1,13 +1,14 @@
+import asyncio
 import discord
 from discord.ext import commands
 from discord import app_commands
-import os
-from ..valorant_api import ValorantAPI
 from ..utils.ui_helpers import UIHelpers
+from ..rank_snapshot import RankSnapshot
 
 class Rank(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self._revalidate_tasks = set()  # バックグラウンド更新中のタスク
     
     @app_commands.command(name="rank", description="プレイヤーのValorantランク情報を表示 (デフォルト: AP)")
     @app_commands.describe(
@@ -37,16 +38,32 @@ class Rank(commands.Cog):
         await interaction.response.defer()
         
         try:
-            valorant_api = ValorantAPI(os.getenv('VALORANT_API_KEY'))
-            rank_data = await valorant_api.get_player_rank(region, name, tag)
+            valorant_api = self.bot.valorant_api
             
-            if not rank_data.get("data"):
+            # キャッシュにあれば即座に表示し、古い場合はバックグラウンドで更新する
+            cached = await valorant_api.get_cached_player_rank(region, name, tag)
+            if cached is not None:
+                snapshot, age, fresh = cached
+                if fresh:
+                    await interaction.followup.send(embed=self.create_rank_embed(name, tag, snapshot, region))
+                    return
+                
+                embed = self.create_rank_embed(name, tag, snapshot, region, stale_age=age)
+                message = await interaction.followup.send(embed=embed, wait=True)
+                task = asyncio.create_task(self.revalidate_rank(message, region, name, tag))
+                self._revalidate_tasks.add(task)
+                task.add_done_callback(self._revalidate_tasks.discard)
+                return
+            
+            try:
+                snapshot = await valorant_api.refresh_player_rank(region, name, tag)
+            except ValueError:
                 await interaction.followup.send(
                     f"プレイヤー **{name}#{tag}** のランク情報が見つかりませんでした。"
                 )
                 return
             
-            embed = self.create_rank_embed(name, tag, rank_data["data"], region)
+            embed = self.create_rank_embed(name, tag, snapshot, region)
             await interaction.followup.send(embed=embed)
             
         except ValueError as e:
@@ -60,14 +77,21 @@ class Rank(commands.Cog):
             print(f"Rank command error: {e}")
             await interaction.followup.send("ランク情報の取得中にエラーが発生しました。")
     
-    def create_rank_embed(self, name: str, tag: str, rank_data: dict, region: str) -> discord.Embed:
+    async def revalidate_rank(self, message: discord.Message, region: str, name: str, tag: str):
+        """ランク情報を取得し直して表示中のメッセージを編集"""
+        try:
+            snapshot = await self.bot.valorant_api.refresh_player_rank(region, name, tag)
+            await message.edit(embed=self.create_rank_embed(name, tag, snapshot, region))
+        except discord.NotFound:
+            pass  # 更新前にメッセージが削除された
+        except Exception as e:
+            print(f"Rank revalidation error for {name}#{tag}: {e}")
+    
+    def create_rank_embed(self, name: str, tag: str, snapshot: RankSnapshot, region: str,
+                          stale_age: float = None) -> discord.Embed:
         """かっこいいランク情報用のEmbedを作成"""
-        current = rank_data.get("current", {})
-        peak = rank_data.get("peak", {})
-        
         # プレイヤーの現在のランクに基づいて色を決定
-        current_tier = current.get("tier", {})
-        current_rank = current_tier.get("name", "Unrated")
+        current_rank = snapshot.tier_name
         embed_color = UIHelpers.get_rank_color(current_rank)
         
         rank_emoji = UIHelpers.get_rank_emoji(current_rank)
@@ -78,42 +102,34 @@ class Rank(commands.Cog):
             timestamp=discord.utils.utcnow()
         )
         
-        if current:
-            rr = current.get("rr", 0)
-            
-            # メインランク表示をかっこよく
-            rank_display = UIHelpers.format_rank_display(current_rank, rr)
-            embed.add_field(name="🎯 現在のランク", value=rank_display, inline=False)
-            
-            # 地域とLeaderboard順位
-            region_flag = {"ap": "🏳️‍🌈", "na": "🇺🇸", "eu": "🇪🇺", "kr": "🇰🇷", "latam": "🌎", "br": "🇧🇷"}.get(region, "🌍")
-            embed.add_field(name="🌍 地域", value=f"{region_flag} {region.upper()}", inline=True)
-            
-            leaderboard = current.get("leaderboard_placement", {})
-            if leaderboard and leaderboard.get("rank"):
-                embed.add_field(name="🏆 Leaderboard順位", value=f"**#{leaderboard['rank']}**", inline=True)
-            else:
-                embed.add_field(name="🏆 Leaderboard", value="圏外", inline=True)
-            
-                
+        # メインランク表示をかっこよく
+        rank_display = UIHelpers.format_rank_display(current_rank, snapshot.rr)
+        embed.add_field(name="🎯 現在のランク", value=rank_display, inline=False)
+        
+        # 地域とLeaderboard順位
+        region_flag = {"ap": "🏳️‍🌈", "na": "🇺🇸", "eu": "🇪🇺", "kr": "🇰🇷", "latam": "🌎", "br": "🇧🇷"}.get(region, "🌍")
+        embed.add_field(name="🌍 地域", value=f"{region_flag} {region.upper()}", inline=True)
+        
+        if snapshot.leaderboard_rank:
+            embed.add_field(name="🏆 Leaderboard順位", value=f"**#{snapshot.leaderboard_rank}**", inline=True)
         else:
-            embed.description = "❌ このプレイヤーのランク情報が見つかりませんでした"
+            embed.add_field(name="🏆 Leaderboard", value="圏外", inline=True)
         
         # 最高ランクを豪華に表示
-        if peak:
-            peak_tier = peak.get("tier", {})
-            peak_rank = peak_tier.get("name", "不明")
-            peak_rr = peak.get("rr", 0)
-            peak_emoji = UIHelpers.get_rank_emoji(peak_rank)
+        if snapshot.peak_tier_name:
+            peak_emoji = UIHelpers.get_rank_emoji(snapshot.peak_tier_name)
             
             embed.add_field(
                 name="👑 最高到達ランク", 
-                value=f"{peak_emoji} **{peak_rank}** ({peak_rr}RR)", 
+                value=f"{peak_emoji} **{snapshot.peak_tier_name}** ({snapshot.peak_rr}RR)", 
                 inline=False
             )
         
+        footer_text = "⚡ Powered by Henrik Valorant API"
+        if stale_age is not None:
+            footer_text += f" • 🕒 {UIHelpers.format_data_age(stale_age)}のデータ（更新中…）"
         embed.set_footer(
-            text="⚡ Powered by Henrik Valorant API",
+            text=footer_text,
             icon_url="https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/0/smallicon.png"
         )
         
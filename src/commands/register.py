@@ -1,9 +1,7 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-import os
-from ..valorant_api import ValorantAPI
-from ..data_manager import DataManager
+from ..rate_limiter import Priority
 from ..utils.ui_helpers import UIHelpers
 from datetime import datetime
 
@@ -45,21 +43,23 @@ class Register(commands.Cog):
         await interaction.response.defer(ephemeral=True)
         
         try:
-            valorant_api = ValorantAPI(os.getenv('VALORANT_API_KEY'))
+            valorant_api = self.bot.valorant_api
             
             # アカウントの存在確認
-            account_data = await valorant_api.get_account(name, player_tag)
+            account_data = await valorant_api.get_account(name, player_tag, priority=Priority.REGISTRATION)
             if not account_data.get("data"):
                 await interaction.followup.send(
                     f"プレイヤー **{name}#{player_tag}** が見つかりませんでした。名前とタグを確認してください。"
                 )
                 return
             
-            # ランク情報を取得して登録確認に表示
-            rank_data = await valorant_api.get_player_rank(region, name, player_tag)
+            # ランク情報を取得して登録確認に表示（キャッシュにも保存される）
+            snapshot = await valorant_api.refresh_player_rank(
+                region, name, player_tag, priority=Priority.REGISTRATION
+            )
             
             # プレイヤーデータを保存
-            data_manager = DataManager()
+            data_manager = self.bot.data_manager
             await data_manager.store_player_data(
                 str(interaction.guild_id), 
                 str(interaction.user.id), 
@@ -73,10 +73,8 @@ class Register(commands.Cog):
             )
             
             # 登録確認Embedを豪華に作成
-            current_data = rank_data.get("data", {}).get("current", {})
-            current_tier = current_data.get("tier", {})
-            current_rank = current_tier.get("name", "Unrated")
-            rr = current_data.get("rr", 0)
+            current_rank = snapshot.tier_name
+            rr = snapshot.rr
             
             rank_emoji = UIHelpers.get_rank_emoji(current_rank)
             rank_color = UIHelpers.get_rank_color(current_rank)
@@ -96,9 +94,8 @@ class Register(commands.Cog):
             embed.add_field(name="🌍 地域", value=f"{region_flag} {region.upper()}", inline=True)
             
             # Leaderboard順位があれば表示
-            leaderboard = current_data.get("leaderboard_placement", {})
-            if leaderboard and leaderboard.get("rank"):
-                embed.add_field(name="🏆 順位", value=f"**#{leaderboard['rank']}**", inline=True)
+            if snapshot.leaderboard_rank:
+                embed.add_field(name="🏆 順位", value=f"**#{snapshot.leaderboard_rank}**", inline=True)
             else:
                 embed.add_field(name="🏆 順位", value="集計中...", inline=True)
             
@@ -1,7 +1,6 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from ..data_manager import DataManager
 
 class Unregister(commands.Cog):
     def __init__(self, bot):
@@ -24,16 +23,10 @@ class Unregister(commands.Cog):
         name, tag = player.split('#', 1)
         
         try:
-            data_manager = DataManager()
+            data_manager = self.bot.data_manager
             
-            # 全プレイヤーから該当アカウントを検索
-            guild_players = await data_manager.get_guild_players(str(interaction.guild_id))
-            target_player = None
-            
-            for player_data in guild_players:
-                if player_data.get("name") == name and player_data.get("tag") == tag:
-                    target_player = player_data
-                    break
+            # name#tagの索引から該当アカウントを検索
+            target_player = await data_manager.find_player(str(interaction.guild_id), name, tag)
             
             if not target_player:
                 await interaction.followup.send(
@@ -42,37 +35,21 @@ class Unregister(commands.Cog):
                 return
             
             # puuidを使用してプレイヤーデータを削除
-            file_path = data_manager._get_guild_file_path(str(interaction.guild_id))
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    guild_data = json.load(f)
-                
-                puuid = target_player.get("puuid")
-                if puuid and puuid in guild_data.get("players", {}):
-                    del guild_data["players"][puuid]
-                    
-                    # ファイルに保存
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(guild_data, f, ensure_ascii=False, indent=2)
-                    
-                    embed = discord.Embed(
-                        title="👋 **LEADERBOARD退出**",
-                        description=f"```ansi\n\u001b[1;31m🚪 {name}#{tag} が退出しました\u001b[0m\n```",
-                        color=0xFF6B6B,
-                        timestamp=discord.utils.utcnow()
-                    )
-                    embed.add_field(
-                        name="📊 ステータス", 
-                        value="✅ データ削除完了\n🔄 Leaderboard更新済み", 
-                        inline=False
-                    )
-                    await interaction.followup.send(embed=embed)
-                else:
-                    await interaction.followup.send("登録解除中にエラーが発生しました。")
-                    
-            except Exception as e:
-                print(f"File operation error: {e}")
+            puuid = target_player.get("puuid")
+            if puuid and await data_manager.remove_player_by_puuid(str(interaction.guild_id), puuid):
+                embed = discord.Embed(
+                    title="👋 **LEADERBOARD退出**",
+                    description=f"```ansi\n\u001b[1;31m🚪 {name}#{tag} が退出しました\u001b[0m\n```",
+                    color=0xFF6B6B,
+                    timestamp=discord.utils.utcnow()
+                )
+                embed.add_field(
+                    name="📊 ステータス", 
+                    value="✅ データ削除完了\n🔄 Leaderboard更新済み", 
+                    inline=False
+                )
+                await interaction.followup.send(embed=embed)
+            else:
                 await interaction.followup.send("登録解除中にエラーが発生しました。")
                 
         except Exception as e:
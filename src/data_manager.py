@@ -1,149 +1,115 @@
-import json
-import os
 import asyncio
 from typing import List, Dict, Optional
-from pathlib import Path
 from datetime import datetime
+from .guild_registry import GuildRegistry
+from .storage import Storage, create_storage
 
 class DataManager:
-    def __init__(self):
-        self.data_dir = Path(__file__).parent.parent / "data"
-        self.data_dir.mkdir(exist_ok=True)
+    def __init__(self, storage: Optional[Storage] = None):
+        self.storage = storage or create_storage()
+        self._guild_locks: Dict[str, asyncio.Lock] = {}  # 同じギルドへの同時更新を直列化
+        self._registries: Dict[str, GuildRegistry] = {}  # guild_id -> 登録プレイヤーの索引
+        self._enabled_auto_updates: Optional[Dict[str, Dict]] = None  # 自動更新が有効なギルドの設定
     
-    def _get_guild_file_path(self, guild_id: str) -> Path:
-        """ギルドのデータファイルパスを取得"""
-        return self.data_dir / f"{guild_id}.json"
+    def _get_guild_lock(self, guild_id: str) -> asyncio.Lock:
+        """ギルドごとの更新用ロックを取得"""
+        lock = self._guild_locks.get(guild_id)
+        if lock is None:
+            lock = self._guild_locks[guild_id] = asyncio.Lock()
+        return lock
+    
+    async def _get_registry(self, guild_id: str) -> GuildRegistry:
+        """ギルドの登録プレイヤーの索引を取得（初回のみ保存先から読み込む）"""
+        registry = self._registries.get(guild_id)
+        if registry is None:
+            loaded = GuildRegistry(await self.storage.get_guild_players(guild_id))
+            # 読み込み中に別のタスクが先に読み込んだ場合はそちらを使う
+            registry = self._registries.setdefault(guild_id, loaded)
+        return registry
     
     async def get_guild_players(self, guild_id: str) -> List[Dict]:
         """ギルドの全プレイヤーデータを取得"""
-        file_path = self._get_guild_file_path(guild_id)
-        
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                guild_data = json.load(f)
-            
-            # puuidをキーとしたplayersデータを配列形式に変換
-            players = []
-            for puuid, player_data in guild_data.get("players", {}).items():
-                player_data["puuid"] = puuid  # puuidを明示的に追加
-                players.append(player_data)
-            
-            return players
-            
-        except (FileNotFoundError, json.JSONDecodeError):
-            # データディレクトリを作成
-            os.makedirs(self.data_dir, exist_ok=True)
-            return []
+            return (await self._get_registry(guild_id)).players()
         except Exception as e:
             print(f"Error reading guild data: {e}")
             return []
     
+    async def find_player(self, guild_id: str, name: str, tag: str) -> Optional[Dict]:
+        """name#tag（大文字小文字を区別しない）から登録プレイヤーを取得"""
+        return (await self._get_registry(guild_id)).find_by_riot_id(name, tag)
+    
+    async def get_all_registered_players(self) -> List[Dict]:
+        """全ギルドの登録プレイヤーを取得（同じプレイヤーは1件にまとめる）"""
+        players = {}
+        for guild_id in await self.storage.list_guild_ids():
+            for player in await self.get_guild_players(guild_id):
+                players.setdefault(player["puuid"], player)
+        return list(players.values())
     
     async def store_player_data(self, guild_id: str, user_id: str, player_data: Dict):
         """プレイヤーデータを保存（puuidをキーとして使用）"""
-        file_path = self._get_guild_file_path(guild_id)
-        
-        # 既存データを読み込み
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                guild_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            guild_data = {}
-        
-        # プレイヤーデータを更新（puuidをキーとして使用）
-        if "players" not in guild_data:
-            guild_data["players"] = {}
-        
+        player_data["discord_user_id"] = user_id
         player_data["updated_at"] = datetime.now().isoformat()
         
         # puuidをキーとして保存
         puuid = player_data.get("puuid")
         if puuid:
-            guild_data["players"][puuid] = player_data
-        
-        # ファイルに保存
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(guild_data, f, ensure_ascii=False, indent=2)
+            async with self._get_guild_lock(guild_id):
+                registry = await self._get_registry(guild_id)
+                await self.storage.upsert_player(guild_id, puuid, player_data)
+                registry.add(dict(player_data))
     
     async def remove_player_data(self, guild_id: str, user_id: str) -> bool:
         """プレイヤーデータを削除（そのDiscordユーザーの最新アカウント）"""
-        file_path = self._get_guild_file_path(guild_id)
-        
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                guild_data = json.load(f)
-            
-            if "players" not in guild_data:
-                return False
-            
-            # Discord IDに紐づく最新のプレイヤーを検索
-            target_puuid = None
-            latest_time = ""
-            
-            for puuid, player_data in guild_data["players"].items():
-                if player_data.get("discord_user_id") == user_id:
-                    updated_at = player_data.get("updated_at", "")
-                    if updated_at > latest_time:
-                        latest_time = updated_at
-                        target_puuid = puuid
-            
-            if target_puuid:
-                del guild_data["players"][target_puuid]
+            async with self._get_guild_lock(guild_id):
+                registry = await self._get_registry(guild_id)
                 
-                # ファイルに保存
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(guild_data, f, ensure_ascii=False, indent=2)
+                # Discord IDに紐づく最新のプレイヤーを検索
+                user_players = registry.find_by_user(user_id)
+                if not user_players:
+                    return False
                 
-                return True
+                target = max(user_players, key=lambda p: p.get("updated_at", ""))
+                return await self._remove_player(guild_id, registry, target["puuid"])
             
+        except Exception as e:
+            print(f"Error removing player data: {e}")
             return False
-            
+    
+    async def remove_player_by_puuid(self, guild_id: str, puuid: str) -> bool:
+        """puuidを指定してプレイヤーデータを削除"""
+        try:
+            async with self._get_guild_lock(guild_id):
+                registry = await self._get_registry(guild_id)
+                return await self._remove_player(guild_id, registry, puuid)
         except Exception as e:
             print(f"Error removing player data: {e}")
             return False
     
+    async def _remove_player(self, guild_id: str, registry: GuildRegistry, puuid: str) -> bool:
+        """保存先と索引の両方からプレイヤーを削除（ギルドのロックを取得して呼ぶ）"""
+        removed = await self.storage.delete_player(guild_id, puuid)
+        registry.remove(puuid)
+        return removed
+    
     async def store_auto_update_config(self, guild_id: str, config: Dict):
         """自動更新設定を保存"""
-        file_path = self._get_guild_file_path(guild_id)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                guild_data = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            guild_data = {}
-        
-        guild_data["auto_update"] = config
-        
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(guild_data, f, ensure_ascii=False, indent=2)
+        async with self._get_guild_lock(guild_id):
+            await self.storage.set_auto_update_config(guild_id, config)
+            if self._enabled_auto_updates is not None:
+                if config.get("enabled"):
+                    self._enabled_auto_updates[guild_id] = config
+                else:
+                    self._enabled_auto_updates.pop(guild_id, None)
     
     async def get_auto_update_config(self, guild_id: str) -> Optional[Dict]:
         """自動更新設定を取得"""
-        file_path = self._get_guild_file_path(guild_id)
-        
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                guild_data = json.load(f)
-            return guild_data.get("auto_update")
-        except (FileNotFoundError, json.JSONDecodeError):
-            return None
+        return await self.storage.get_auto_update_config(guild_id)
     
-    async def get_all_auto_update_configs(self) -> Dict[str, Dict]:
-        """すべてのギルドの自動更新設定を取得"""
-        configs = {}
-        
-        for file_path in self.data_dir.glob("*.json"):
-            guild_id = file_path.stem
-            
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    guild_data = json.load(f)
-                
-                auto_update = guild_data.get("auto_update")
-                if auto_update:
-                    configs[guild_id] = auto_update
-                    
-            except (json.JSONDecodeError, FileNotFoundError):
-                continue
-        
-        return configs
\ No newline at end of file
+    async def get_enabled_auto_update_configs(self) -> Dict[str, Dict]:
+        """自動更新が有効なギルドの設定を取得（初回以降はメモリ上の索引から返す）"""
+        if self._enabled_auto_updates is None:
+            self._enabled_auto_updates = await self.storage.get_enabled_auto_update_configs()
+        return dict(self._enabled_auto_updates)
@@ -0,0 +1,98 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Set, Tuple
+from .rank_snapshot import RankSnapshot
+
+class GuildRanking:
+    """1ギルドの順位表
+
+    (-ソートキー, player_key)を昇順に並べたリストを保持し、1人分の更新は
+    二分探索で古い位置を消して挿入し直すだけにする。上位k人の取得はO(k)。
+    """
+
+    def __init__(self):
+        self._order: List[Tuple[int, str]] = []  # (-sort_key, player_key) の昇順
+        self._keys: Dict[str, int] = {}  # player_key -> 並び替えに使っている-sort_key
+        self._snapshots: Dict[str, RankSnapshot] = {}
+        self.version = 0  # 内容が変わるたびに増える
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def update(self, player_key: str, snapshot: RankSnapshot):
+        """1人分のランクを反映"""
+        if self._snapshots.get(player_key) is snapshot:
+            return
+        self._snapshots[player_key] = snapshot
+        self.version += 1
+
+        new_key = -snapshot.sort_key
+        old_key = self._keys.get(player_key)
+        if old_key == new_key:
+            return
+        if old_key is not None:
+            del self._order[bisect_left(self._order, (old_key, player_key))]
+        insort(self._order, (new_key, player_key))
+        self._keys[player_key] = new_key
+
+    def remove(self, player_key: str):
+        """順位表からプレイヤーを削除"""
+        old_key = self._keys.pop(player_key, None)
+        if old_key is None:
+            return
+        del self._order[bisect_left(self._order, (old_key, player_key))]
+        del self._snapshots[player_key]
+        self.version += 1
+
+    def top(self, k: int) -> List[RankSnapshot]:
+        """上位k人を順位順に取得"""
+        return [self._snapshots[player_key] for _, player_key in self._order[:k]]
+
+    def player_keys(self) -> List[str]:
+        """順位表に載っているプレイヤーのキー"""
+        return list(self._keys)
+
+    def snapshots(self) -> Iterable[RankSnapshot]:
+        """順位表に載っている全員のデータ（順不同）"""
+        return self._snapshots.values()
+
+class RankingIndex:
+    """全ギルドの順位表
+
+    ギルドごとの登録プレイヤーを覚えておき、キャッシュが1人分更新されたときは
+    そのプレイヤーが登録されているギルドの順位表だけを差分で更新する。
+    """
+
+    def __init__(self):
+        self._guilds: Dict[str, GuildRanking] = {}
+        self._members: Dict[str, Set[str]] = {}  # guild_id -> 登録プレイヤーのキー
+        self._player_guilds: Dict[str, Set[str]] = {}  # player_key -> 登録されているギルド
+
+    def get(self, guild_id: str) -> GuildRanking:
+        """ギルドの順位表を取得"""
+        ranking = self._guilds.get(guild_id)
+        if ranking is None:
+            ranking = self._guilds[guild_id] = GuildRanking()
+        return ranking
+
+    def sync_guild(self, guild_id: str, player_keys: Iterable[str],
+                   snapshots: Dict[str, RankSnapshot]) -> GuildRanking:
+        """ギルドの登録プレイヤーと取得済みのデータを反映（変わった分だけ更新）"""
+        ranking = self.get(guild_id)
+        members = set(player_keys)
+        for player_key in self._members.get(guild_id, set()) - members:
+            self._player_guilds.get(player_key, set()).discard(guild_id)
+        for player_key in members:
+            self._player_guilds.setdefault(player_key, set()).add(guild_id)
+        self._members[guild_id] = members
+
+        for player_key in ranking.player_keys():
+            if player_key not in snapshots:
+                ranking.remove(player_key)
+        for player_key, snapshot in snapshots.items():
+            ranking.update(player_key, snapshot)
+        return ranking
+
+    def on_player_updated(self, player_key: str, snapshot: RankSnapshot):
+        """キャッシュの更新をそのプレイヤーが登録されているギルドの順位表に反映"""
+        for guild_id in self._player_guilds.get(player_key, ()):
+            self.get(guild_id).update(player_key, snapshot)
@@ -0,0 +1,71 @@
+from typing import Dict, List, Optional
+
+class GuildRegistry:
+    """1ギルド分の登録プレイヤーとその索引
+
+    puuid・DiscordユーザーID・name#tag（大文字小文字を区別しない）から
+    プレイヤーを引けるようにし、追加・削除のたびに索引も更新する。
+    """
+
+    def __init__(self, players: Dict[str, Dict]):
+        self._players: Dict[str, Dict] = {}  # puuid -> プレイヤーデータ
+        self._by_user: Dict[str, Dict[str, Dict]] = {}  # discord_user_id -> {puuid: プレイヤーデータ}
+        self._by_riot_id: Dict[str, str] = {}  # name#tag（casefold） -> puuid
+        self._list: Optional[List[Dict]] = None  # 一覧のキャッシュ（変更時に破棄）
+        for key, player_data in players.items():
+            player_data.setdefault("puuid", key)  # puuidを明示的に追加（保存済みの値を優先）
+            self.add(player_data)
+
+    def __len__(self) -> int:
+        return len(self._players)
+
+    @staticmethod
+    def riot_id_key(name: str, tag: str) -> str:
+        """name#tagの索引キー"""
+        return f"{name}#{tag}".casefold()
+
+    def players(self) -> List[Dict]:
+        """登録プレイヤーの一覧を取得"""
+        if self._list is None:
+            self._list = list(self._players.values())
+        return list(self._list)
+
+    def find_by_riot_id(self, name: str, tag: str) -> Optional[Dict]:
+        """name#tagからプレイヤーを取得"""
+        puuid = self._by_riot_id.get(self.riot_id_key(name, tag))
+        return self._players.get(puuid) if puuid else None
+
+    def find_by_user(self, user_id: str) -> List[Dict]:
+        """Discordユーザーが登録したプレイヤーを取得"""
+        return list(self._by_user.get(user_id, {}).values())
+
+    def add(self, player_data: Dict):
+        """プレイヤーを追加（同じpuuidがあれば置き換える）"""
+        puuid = player_data["puuid"]
+        self.remove(puuid)
+        self._players[puuid] = player_data
+        user_id = player_data.get("discord_user_id")
+        if user_id:
+            self._by_user.setdefault(user_id, {})[puuid] = player_data
+        if player_data.get("name") and player_data.get("tag"):
+            self._by_riot_id[self.riot_id_key(player_data["name"], player_data["tag"])] = puuid
+        self._list = None
+
+    def remove(self, puuid: str) -> Optional[Dict]:
+        """プレイヤーを削除"""
+        player_data = self._players.pop(puuid, None)
+        if player_data is None:
+            return None
+
+        user_id = player_data.get("discord_user_id")
+        user_players = self._by_user.get(user_id)
+        if user_players is not None:
+            user_players.pop(puuid, None)
+            if not user_players:
+                del self._by_user[user_id]
+        if player_data.get("name") and player_data.get("tag"):
+            riot_id = self.riot_id_key(player_data["name"], player_data["tag"])
+            if self._by_riot_id.get(riot_id) == puuid:
+                del self._by_riot_id[riot_id]
+        self._list = None
+        return player_data
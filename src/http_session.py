@@ -0,0 +1,24 @@
+import os
+from typing import Optional, Tuple
+import aiohttp
+
+def get_pool_limits() -> Tuple[int, int]:
+    """接続プールの全体・ホストごとの同時接続数を取得（0は無制限）"""
+    return int(os.getenv('HTTP_POOL_LIMIT', '20')), int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '10'))
+
+def get_host_connection_limit() -> Optional[int]:
+    """1つのホストに同時に張れる接続数を取得（無制限ならNone）"""
+    limits = [limit for limit in get_pool_limits() if limit > 0]
+    return min(limits) if limits else None
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Bot全体で共有するHTTPセッションを作成（keep-alive接続プール・DNSキャッシュ付き）"""
+    limit, limit_per_host = get_pool_limits()
+    connector = aiohttp.TCPConnector(
+        limit=limit,  # 全体の同時接続数
+        limit_per_host=limit_per_host,  # ホストごとの同時接続数
+        ttl_dns_cache=int(os.getenv('HTTP_DNS_CACHE_TTL', '300')),  # DNSキャッシュ秒数
+        keepalive_timeout=float(os.getenv('HTTP_KEEPALIVE_TIMEOUT', '60'))  # アイドル接続の保持秒数
+    )
+    timeout = aiohttp.ClientTimeout(total=float(os.getenv('HTTP_TIMEOUT', '15')))
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
@@ -0,0 +1,255 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from aiohttp import web
+
+# レイテンシ用のヒストグラムの既定の区切り（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    """ラベルをPrometheusのテキスト形式に変換"""
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = []
+    for name, value in pairs:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+def _format_value(value: float) -> str:
+    """数値をPrometheusのテキスト形式に変換"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """ラベルごとに値の分布を記録するヒストグラム（Prometheus形式で出力できる）"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Labels, List] = {}  # ラベル -> [区切りごとの件数, 合計, 件数]
+
+    def observe(self, value: float, **labels: str):
+        """値を記録"""
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+                break
+        series[1] += value
+        series[2] += 1
+
+    def render(self, name: str, help_text: str) -> List[str]:
+        """Prometheusのテキスト形式の行を作成"""
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels, (bucket_counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(float(bound))))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return lines
+
+class EventLoopMonitor:
+    """一定間隔でsleepし、予定より遅れて起きた時間をイベントループの遅延として記録する"""
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.lag = Histogram((0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5))
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """計測を開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """計測を停止"""
+        if self._task:
+            self._task.cancel()
+
+    async def _run(self):
+        """メインループ: sleepの遅れを記録"""
+        while True:
+            started_at = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - started_at - self.interval)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.lag.observe(lag)
+
+class MetricsServer:
+    """Botの各コンポーネントの統計情報を/metricsでPrometheus形式に公開するHTTPサーバー
+
+    値は各コンポーネントのget_stats()などからリクエストのたびに集めるため、
+    記録側はメトリクスの出力形式を気にしなくてよい。
+    """
+
+    def __init__(self, bot, host: str = "127.0.0.1", port: int = 9108):
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.loop_monitor = EventLoopMonitor()
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self):
+        """HTTPサーバーとイベントループの計測を開始"""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, self.host, self.port).start()
+        except OSError as e:
+            await runner.cleanup()
+            print(f"Failed to start metrics server on {self.host}:{self.port}: {e}")
+            return
+        self._runner = runner
+        self.loop_monitor.start()
+        print(f"Metrics server listening on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        """HTTPサーバーを停止"""
+        self.loop_monitor.stop()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        """/metricsのハンドラ"""
+        return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+    def render(self) -> str:
+        """全メトリクスをPrometheusのテキスト形式で作成"""
+        lines: List[str] = []
+
+        def add(name: str, metric_type: str, help_text: str, samples: Dict[Labels, float]):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples.items():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        def single(value: float) -> Dict[Labels, float]:
+            return {(): value}
+
+        for collect in self._collectors():
+            try:
+                collect(add, single, lines)
+            except Exception as e:
+                # 一部の値が取れなくても残りは出力する
+                print(f"Error collecting metrics: {e}")
+
+        return "\n".join(lines) + "\n"
+
+    def _collectors(self) -> List[Callable]:
+        """メトリクスを集める関数の一覧"""
+        return [self._collect_api, self._collect_cache, self._collect_retry, self._collect_auto_update,
+                self._collect_discord, self._collect_event_loop]
+
+    def _collect_api(self, add, single, lines):
+        """APIリクエスト・レート制限・同時実行数"""
+        api = self.bot.valorant_api
+        if api is None:
+            return
+        lines.extend(api.request_latency.render(
+            "valorant_api_request_duration_seconds", "Henrik API request latency by endpoint and status"
+        ))
+        stats = api.get_request_stats()
+        add("valorant_api_requests_total", "counter", "API requests sent (after coalescing)",
+            single(stats["requests"]))
+        add("valorant_api_coalesced_total", "counter", "Calls that joined an in-flight request",
+            single(stats["coalesced"]))
+
+        limiter = api.rate_limiter.get_stats()
+        add("valorant_api_throttled_total", "counter", "HTTP 429 responses", single(limiter["throttled"]))
+        add("valorant_api_rate_limit_waiting", "gauge", "Requests waiting for a rate limit token by lane", {
+            (("lane", lane),): lane_stats["waiting"] for lane, lane_stats in limiter["lanes"].items()
+        })
+        add("valorant_api_rate_limit_wait_p95_seconds", "gauge", "p95 rate limit wait by lane", {
+            (("lane", lane),): lane_stats["p95_wait"] for lane, lane_stats in limiter["lanes"].items()
+        })
+
+        concurrency = stats["concurrency"]
+        add("valorant_api_concurrency_window", "gauge", "Adaptive concurrency window",
+            single(concurrency["window"]))
+        add("valorant_api_concurrency_in_flight", "gauge", "Fetches holding a concurrency slot",
+            single(concurrency["in_flight"]))
+        add("valorant_api_concurrency_decisions_total", "counter", "Adaptive concurrency decisions", {
+            (("decision", decision),): count for decision, count in concurrency["decisions"].items()
+        })
+
+        circuit = stats["circuit"]
+        add("valorant_api_circuit_open", "gauge", "1 if the circuit breaker is not closed",
+            single(0 if circuit["state"] == "closed" else 1))
+        add("valorant_api_circuit_trips_total", "counter", "Times the circuit breaker opened",
+            single(circuit["trips"]))
+
+    def _collect_cache(self, add, single, lines):
+        """ランクキャッシュ"""
+        if self.bot.valorant_api is None:
+            return
+        stats = self.bot.valorant_api.cache.get_stats()
+        add("rank_cache_lookups_total", "counter", "Rank cache lookups by result", {
+            (("result", "hit"),): stats["hits"],
+            (("result", "stale"),): stats["stale_hits"],
+            (("result", "miss"),): stats["misses"],
+            (("result", "not_found"),): stats["not_found_hits"]
+        })
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        add("rank_cache_ratio", "gauge", "Share of rank cache lookups by result", {
+            (("result", "hit"),): stats["hit_ratio"],
+            (("result", "stale"),): round(stats["stale_hits"] / lookups, 3) if lookups else 0.0,
+            (("result", "miss"),): round(stats["misses"] / lookups, 3) if lookups else 0.0
+        })
+        add("rank_cache_entries", "gauge", "Entries in the rank cache", single(stats["entries"]))
+        add("rank_cache_evictions_total", "counter", "Entries evicted by the LRU limit", single(stats["evictions"]))
+        add("rank_cache_reloads_total", "counter", "Evicted entries read back from storage", single(stats["reloads"]))
+
+    def _collect_retry(self, add, single, lines):
+        """再試行キュー・先読み"""
+        if self.bot.retry_manager is not None:
+            add("retry_queue_depth", "gauge", "Players waiting for a retry",
+                single(self.bot.retry_manager.get_stats()["queue_depth"]))
+        if self.bot.prefetcher is not None:
+            stats = self.bot.prefetcher.get_stats()
+            add("prefetch_players", "gauge", "Players tracked by the prefetcher", single(stats["players"]))
+
+    def _collect_auto_update(self, add, single, lines):
+        """自動更新"""
+        cog = self.bot.get_cog("AutoUpdate")
+        if cog is None:
+            return
+        scheduler = cog.scheduler
+        lines.extend(scheduler.durations.render(
+            "auto_update_cycle_duration_seconds", "Duration of one auto-update cycle"
+        ))
+        add("auto_update_last_cycle_duration_seconds", "gauge", "Duration of the last auto-update cycle by guild", {
+            (("guild", guild_id),): duration for guild_id, duration in scheduler.last_durations.items()
+        })
+
+    def _collect_discord(self, add, single, lines):
+        """Discordのメッセージ編集"""
+        samples = {}
+        for cog_name in ("Leaderboard", "AutoUpdate"):
+            cog = self.bot.get_cog(cog_name)
+            if cog is None:
+                continue
+            for kind, count in cog.edit_stats.items():
+                samples[(("source", cog_name.lower()), ("kind", kind))] = count
+        add("discord_message_edits_total", "counter", "Discord message edits (and skipped edits) by source", samples)
+
+    def _collect_event_loop(self, add, single, lines):
+        """イベントループの遅延"""
+        monitor = self.loop_monitor
+        lines.extend(monitor.lag.render("event_loop_lag_seconds", "Event loop scheduling delay"))
+        add("event_loop_lag_max_seconds", "gauge", "Largest observed event loop delay", single(monitor.max_lag))
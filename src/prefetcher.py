@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from .valorant_api import ValorantAPI
+from .data_manager import DataManager
+
+class Prefetcher:
+    """登録プレイヤーのランクデータをキャッシュ切れの少し前に先読みするクラス
+
+    全ギルドの登録プレイヤー（puuid単位）とキャッシュの有効期限を把握し、
+    期限の近い順に一定のペースで取得し直す。ペースはAPIのレート制限から決めるため、
+    表示時はほぼキャッシュから返せて、APIへのリクエストも時間的に平らになる。
+    """
+
+    def __init__(self, api: ValorantAPI, data_manager: DataManager):
+        self.api = api
+        self.cache = api.cache
+        self.data_manager = data_manager
+        # レート制限のうち先読みに使う割合（残りは表示・登録用に空けておく）
+        self.budget_ratio = float(os.getenv('PREFETCH_BUDGET_RATIO', '0.5'))
+        self.lead_time = float(os.getenv('PREFETCH_LEAD_MINUTES', '5')) * 60  # 期限の何秒前に取得するか
+        self.retry_delay = float(os.getenv('PREFETCH_RETRY_DELAY', '300'))  # 失敗時に次を試すまでの秒数
+        self.reload_interval = float(os.getenv('PREFETCH_RELOAD_INTERVAL', '120'))  # 登録プレイヤーを読み直す間隔
+        self.default_region = os.getenv('DEFAULT_REGION', 'ap')
+
+        self._players: Dict[str, Dict] = {}  # player_key -> 登録データ
+        self._due: Dict[str, float] = {}  # player_key -> 次回の先読み時刻
+        self._heap: List[Tuple[float, str]] = []
+        self._last_reload = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+        # 統計情報
+        self.stats = {"refreshed": 0, "failed": 0, "skipped": 0}
+
+    def get_interval(self) -> float:
+        """先読み1件ごとの間隔（秒）をAPIの予算から求める"""
+        rate = self.api.rate_limiter.rate * self.budget_ratio
+        return 1 / rate if rate > 0 else 60.0
+
+    def start(self):
+        """先読みを開始"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        """先読みを停止"""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _schedule(self, player_key: str, due_at: float):
+        """次回の先読み時刻を登録"""
+        self._due[player_key] = due_at
+        heapq.heappush(self._heap, (due_at, player_key))
+
+    async def _get_due(self, player_key: str) -> float:
+        """キャッシュの有効期限から先読みする時刻を求める（キャッシュがなければ今すぐ）"""
+        expires_at = await self.cache.get_expires_at(player_key)
+        if expires_at is None:
+            return 0.0
+        return expires_at - self.lead_time
+
+    async def _reload(self):
+        """登録プレイヤーを読み直し、新しいプレイヤーをスケジュールに追加"""
+        players = {
+            self.cache.player_key(player): player
+            for player in await self.data_manager.get_all_registered_players()
+        }
+        for player_key in players:
+            if player_key not in self._due:
+                self._schedule(player_key, await self._get_due(player_key))
+
+        # 登録解除されたプレイヤーを削除（ヒープ内の古いエントリは取り出し時に無視する）
+        for player_key in list(self._due):
+            if player_key not in players:
+                del self._due[player_key]
+
+        self._players = players
+        self._last_reload = time.time()
+
+    async def _run(self):
+        """期限の近いプレイヤーから一定間隔で先読みする"""
+        while True:
+            try:
+                now = time.time()
+                if now - self._last_reload >= self.reload_interval:
+                    await self._reload()
+                    now = time.time()
+
+                if self._heap and self._heap[0][0] <= now:
+                    due_at, player_key = heapq.heappop(self._heap)
+                    if self._due.get(player_key) != due_at:
+                        continue  # 登録解除・再スケジュール済みのエントリ
+
+                    # 表示時などに既に更新されていれば、新しい期限で入れ直す
+                    new_due = await self._get_due(player_key)
+                    if new_due > now:
+                        self.stats["skipped"] += 1
+                        self._schedule(player_key, new_due)
+                        continue
+
+                    await self._refresh(player_key, self._players[player_key])
+                    await asyncio.sleep(self.get_interval())
+                    continue
+
+                # 次の先読み時刻か登録プレイヤーの読み直し時刻まで待機
+                wait = self._last_reload + self.reload_interval - now
+                if self._heap:
+                    wait = min(wait, self._heap[0][0] - now)
+                await asyncio.sleep(max(0.0, wait))
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in prefetcher: {e}")
+                await asyncio.sleep(5)
+
+    async def _refresh(self, player_key: str, player: Dict):
+        """1人分のランクデータを取得し直してキャッシュを更新"""
+        failed = await self.api.refresh_players([player], self.default_region)
+        if failed:
+            self.stats["failed"] += 1
+            self._schedule(player_key, time.time() + self.retry_delay)
+        else:
+            self.stats["refreshed"] += 1
+            self._schedule(player_key, await self._get_due(player_key))
+
+    def get_stats(self) -> Dict:
+        """先読みの統計情報を取得"""
+        next_due = self._heap[0][0] - time.time() if self._heap else None
+        return {
+            **self.stats,
+            "players": len(self._players),
+            "interval": round(self.get_interval(), 2),
+            "next_due_in": round(next_due, 1) if next_due is not None else None
+        }
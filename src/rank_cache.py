@@ -1,161 +1,337 @@
-import json
 import os
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from collections import OrderedDict
 import asyncio
+from .storage import Storage, create_storage
+from .rank_snapshot import RankSnapshot
 
 class RankCache:
-    """プレイヤーのランクデータをキャッシュするクラス"""
-    
-    def __init__(self):
-        self.cache_dir = "data/cache"
-        self.cache_file = "rank_cache.json"
-        self.retry_queue_file = "retry_queue.json"
-        self.cache_duration = timedelta(hours=1)  # キャッシュの有効期限
-        self.ensure_cache_dir()
-    
-    def ensure_cache_dir(self):
-        """キャッシュディレクトリを作成"""
-        if not os.path.exists(self.cache_dir):
-            os.makedirs(self.cache_dir)
-    
-    def get_cache_path(self, guild_id: str) -> str:
-        """ギルドごとのキャッシュファイルパスを取得"""
-        return os.path.join(self.cache_dir, f"{guild_id}_{self.cache_file}")
-    
-    def get_retry_queue_path(self, guild_id: str) -> str:
-        """ギルドごとの再試行キューファイルパスを取得"""
-        return os.path.join(self.cache_dir, f"{guild_id}_{self.retry_queue_file}")
-    
-    async def load_cache(self, guild_id: str) -> Dict[str, Any]:
-        """キャッシュを読み込む"""
-        cache_path = self.get_cache_path(guild_id)
-        if os.path.exists(cache_path):
-            try:
-                with open(cache_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except:
-                return {}
-        return {}
-    
-    async def save_cache(self, guild_id: str, cache_data: Dict[str, Any]):
-        """キャッシュを保存"""
-        cache_path = self.get_cache_path(guild_id)
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(cache_data, f, ensure_ascii=False, indent=2)
-    
-    async def get_player_data(self, guild_id: str, player_key: str) -> Optional[Dict]:
-        """プレイヤーのキャッシュデータを取得"""
-        cache = await self.load_cache(guild_id)
-        if player_key in cache:
-            cached_data = cache[player_key]
-            # タイムスタンプをチェック
-            cached_time = datetime.fromisoformat(cached_data.get('timestamp', '2000-01-01'))
-            if datetime.now() - cached_time < self.cache_duration:
-                return cached_data.get('data')
-        return None
-    
-    async def update_player_data(self, guild_id: str, player_key: str, data: Dict):
-        """プレイヤーのデータを更新"""
-        cache = await self.load_cache(guild_id)
-        cache[player_key] = {
-            'data': data,
-            'timestamp': datetime.now().isoformat(),
-            'last_update_attempt': datetime.now().isoformat()
-        }
-        await self.save_cache(guild_id, cache)
+    """プレイヤーのランクデータをキャッシュするクラス
+    ランクデータはギルドをまたいでpuuidをキーとした1つのストアに保存し、
+    ギルド側は登録情報（puuid）で参照するだけにする。
+    読み込みはメモリ上のTTL/LRUキャッシュが正とし、保存先へはまとめて遅延書き込みする。
+    """
     
-    async def mark_update_failed(self, guild_id: str, player_key: str):
-        """更新失敗をマーク（前のデータを保持）"""
-        cache = await self.load_cache(guild_id)
-        if player_key in cache:
-            cache[player_key]['last_update_attempt'] = datetime.now().isoformat()
-            cache[player_key]['failed_attempts'] = cache[player_key].get('failed_attempts', 0) + 1
-            await self.save_cache(guild_id, cache)
-    
-    async def add_to_retry_queue(self, guild_id: str, player_info: Dict):
-        """再試行キューに追加"""
-        queue_path = self.get_retry_queue_path(guild_id)
+    def __init__(self, storage: Optional[Storage] = None):
+        self.storage = storage or create_storage()
+        # ソフトTTL: これより新しいデータはそのまま使う（プレイヤーごとの初期値）
+        self.cache_duration = timedelta(minutes=float(os.getenv('RANK_CACHE_SOFT_TTL_MINUTES', '60')))
+        # ランクの変動に合わせてプレイヤーごとのTTLをこの範囲で調整する
+        self.min_ttl = timedelta(minutes=float(os.getenv('RANK_CACHE_MIN_TTL_MINUTES', '15')))
+        self.max_ttl = timedelta(minutes=float(os.getenv('RANK_CACHE_MAX_TTL_MINUTES', '240')))
+        # ハードTTL: ソフトTTL〜ハードTTLのデータは即座に返しつつバックグラウンドで更新する
+        self.hard_ttl = timedelta(minutes=float(os.getenv('RANK_CACHE_HARD_TTL_MINUTES', '360')))
+        self.max_stale_age = timedelta(days=int(os.getenv('RANK_CACHE_MAX_STALE_DAYS', '7')))  # 古いデータとしても使わない期限
+        self.max_entries = int(os.getenv('RANK_CACHE_MAX_ENTRIES', '5000'))  # メモリに保持する最大件数
+        self.flush_delay = float(os.getenv('RANK_CACHE_FLUSH_DELAY', '5'))  # 書き込みをまとめる待機秒数
+        # 見つからなかった（404）プレイヤーを問い合わせずに済ませる期間
+        self.not_found_ttl = timedelta(minutes=float(os.getenv('RANK_CACHE_NOT_FOUND_TTL_MINUTES', '60')))
         
-        # 既存のキューを読み込む
-        if os.path.exists(queue_path):
-            with open(queue_path, 'r', encoding='utf-8') as f:
-                retry_queue = json.load(f)
-        else:
-            retry_queue = []
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._changed = set()  # 未保存の変更があるキー
+        self._removed = set()  # 未保存の削除があるキー
+        self._evicted = set()  # LRUでメモリから追い出したが保存先には残っているキー
+        self._unsaved: Dict[str, Dict[str, Any]] = {}  # 追い出したエントリのうち未保存の変更があるもの
+        self._riot_ids: Dict[str, str] = {}  # name#tag（小文字） -> キャッシュのキー
+        self._not_found: Dict[str, datetime] = {}  # キー -> 見つからなかった記録の期限
+        self._listeners: List[Callable[[str, RankSnapshot], None]] = []  # 更新を通知する先
         
-        # プレイヤー情報と再試行時刻を追加
-        retry_entry = {
-            'player': player_info,
-            'retry_at': (datetime.now() + timedelta(minutes=2)).isoformat(),
-            'attempts': 0
+        # 統計情報
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale_hits": 0,
+            "evictions": 0,
+            "reloads": 0,  # 追い出したエントリを保存先から読み直した回数
+            "expirations": 0,
+            "flushes": 0,
+            "not_found_hits": 0,
+            "rank_changes": 0,  # 取得し直したときにランク・RRが変わっていた回数
+            "rank_unchanged": 0
         }
-        
-        # 既に同じプレイヤーがキューにいるかチェック
-        player_key = f"{player_info['name']}#{player_info['tag']}"
-        retry_queue = [item for item in retry_queue if f"{item['player']['name']}#{item['player']['tag']}" != player_key]
-        retry_queue.append(retry_entry)
-        
-        # キューを保存
-        with open(queue_path, 'w', encoding='utf-8') as f:
-            json.dump(retry_queue, f, ensure_ascii=False, indent=2)
-    
-    async def get_retry_queue(self, guild_id: str) -> List[Dict]:
-        """再試行が必要なプレイヤーのリストを取得"""
-        queue_path = self.get_retry_queue_path(guild_id)
-        if not os.path.exists(queue_path):
-            return []
-        
-        with open(queue_path, 'r', encoding='utf-8') as f:
-            retry_queue = json.load(f)
-        
-        # 現在時刻を過ぎたエントリーをフィルタ
-        now = datetime.now()
-        ready_for_retry = []
-        remaining_queue = []
-        
-        for entry in retry_queue:
-            retry_time = datetime.fromisoformat(entry['retry_at'])
-            if retry_time <= now and entry['attempts'] < 3:  # 最大3回まで再試行
-                ready_for_retry.append(entry)
-            elif entry['attempts'] < 3:
-                remaining_queue.append(entry)
-        
-        # 残りのキューを保存
-        with open(queue_path, 'w', encoding='utf-8') as f:
-            json.dump(remaining_queue, f, ensure_ascii=False, indent=2)
-        
-        return ready_for_retry
     
-    async def update_retry_attempt(self, guild_id: str, player_info: Dict, success: bool):
-        """再試行の結果を更新"""
-        if success:
-            # 成功した場合はキューから削除（既に削除されているはず）
+    @staticmethod
+    def player_key(player: Dict) -> str:
+        """キャッシュのキーを取得（puuidがない古いデータはname#tag）"""
+        return player.get("puuid") or f"{player['name']}#{player['tag']}".lower()
+    
+    async def _ensure_loaded(self):
+        """初回アクセス時に保存先のエントリをメモリへ読み込む"""
+        if self._loaded:
             return
-        
-        queue_path = self.get_retry_queue_path(guild_id)
-        if not os.path.exists(queue_path):
+        async with self._load_lock:
+            if self._loaded:
+                return
+            stored = await self.storage.load_rank_entries()
+            # 古い順に並べてLRUの順序とする
+            for player_key, entry in sorted(stored.items(), key=lambda item: item[1].get('timestamp', '')):
+                try:
+                    # 保存先が持つ辞書は書き換えずに、メモリ用のエントリを作る
+                    entry = {**entry, 'data': RankSnapshot.from_dict(entry['data'])}
+                except Exception as e:
+                    print(f"Skipping broken rank cache entry {player_key}: {e}")
+                    continue
+                if self._get_age(entry) >= self.max_stale_age:
+                    # 追い出されたまま期限を過ぎたエントリはここで保存先から消す
+                    self._removed.add(player_key)
+                    self.stats["expirations"] += 1
+                    continue
+                self._entries[player_key] = entry
+                self._index_riot_id(player_key, entry)
+                if 'current' in stored[player_key]['data']:
+                    self._changed.add(player_key)  # 以前のAPIレスポンス形式は次の書き込みで縮める
+            self._evict()
+            self._loaded = True
+            if self._changed or self._removed or self._unsaved:
+                self._schedule_flush()
+    
+    def add_listener(self, listener: Callable[[str, RankSnapshot], None]):
+        """プレイヤーのデータが更新されたときに呼ばれる関数を登録"""
+        self._listeners.append(listener)
+    
+    @staticmethod
+    def riot_id_key(name: str, tag: str) -> str:
+        """name#tagの検索用キーを取得"""
+        return f"{name}#{tag}".lower()
+    
+    def _index_riot_id(self, player_key: str, entry: Dict[str, Any]):
+        """name#tagからキャッシュのキーを引けるように登録"""
+        snapshot = entry['data']
+        if snapshot.name is not None and snapshot.tag is not None:
+            self._riot_ids[self.riot_id_key(snapshot.name, snapshot.tag)] = player_key
+    
+    async def find_player_key(self, name: str, tag: str) -> Optional[str]:
+        """name#tagからキャッシュのキーを検索"""
+        await self._ensure_loaded()
+        player_key = self._riot_ids.get(self.riot_id_key(name, tag))
+        if player_key is None:
+            return None
+        await self._reload_evicted(player_key)
+        return player_key if player_key in self._entries else None
+    
+    @staticmethod
+    def get_data_age(snapshot: RankSnapshot) -> float:
+        """データのfetched_atからの経過秒数を取得"""
+        if not snapshot.fetched_at:
+            return 0.0
+        return (datetime.now() - datetime.fromisoformat(snapshot.fetched_at)).total_seconds()
+    
+    def _evict(self):
+        """最大件数を超えた分を古い順にメモリから追い出す（保存先には残し、必要になったら読み直す）"""
+        while len(self._entries) > self.max_entries:
+            player_key, entry = self._entries.popitem(last=False)
+            if player_key in self._changed:
+                # 未保存の変更は捨てずに次の書き込みで保存する
+                self._changed.discard(player_key)
+                self._unsaved[player_key] = entry
+            self._evicted.add(player_key)
+            self.stats["evictions"] += 1
+    
+    async def _reload_evicted(self, player_key: str):
+        """追い出したエントリを保存先（未保存なら手元の分）から読み直してメモリに戻す"""
+        if player_key not in self._evicted:
             return
+        self._evicted.discard(player_key)
+        entry = self._unsaved.pop(player_key, None)
+        if entry is not None:
+            self._changed.add(player_key)
+        else:
+            stored = await self.storage.load_rank_entry(player_key)
+            if stored is None:
+                return
+            try:
+                entry = {**stored, 'data': RankSnapshot.from_dict(stored['data'])}
+            except Exception as e:
+                print(f"Skipping broken rank cache entry {player_key}: {e}")
+                return
+            self.stats["reloads"] += 1
+        if player_key in self._entries:
+            return  # 読み込み中に新しいデータで更新された
+        self._entries[player_key] = entry
+        self._index_riot_id(player_key, entry)
+        self._evict()
+    
+    def _get_entry(self, player_key: str) -> Optional[Dict[str, Any]]:
+        """エントリを取得（期限を大きく過ぎたものは削除）"""
+        entry = self._entries.get(player_key)
+        if entry is None:
+            return None
+        if self._get_age(entry) >= self.max_stale_age:
+            del self._entries[player_key]
+            self._changed.discard(player_key)
+            self._removed.add(player_key)
+            self.stats["expirations"] += 1
+            self._schedule_flush()
+            return None
+        self._entries.move_to_end(player_key)
+        return entry
+    
+    def _get_ttl(self, entry: Dict[str, Any]) -> timedelta:
+        """エントリのソフトTTLを取得（未調整のエントリは初期値）"""
+        ttl = entry.get('ttl')
+        return timedelta(seconds=ttl) if ttl is not None else self.cache_duration
+    
+    @staticmethod
+    def _rank_signature(snapshot: RankSnapshot) -> Tuple[int, int]:
+        """変動の判定に使うランク（ティア・RR）を取得"""
+        return snapshot.tier, snapshot.rr
+    
+    def _next_ttl(self, previous: Optional[Dict[str, Any]], snapshot: RankSnapshot) -> float:
+        """前回のデータと比べてランクが変わっていればTTLを縮め、変わっていなければ伸ばす"""
+        if previous is None:
+            return self.cache_duration.total_seconds()
+        ttl = self._get_ttl(previous)
+        if self._rank_signature(previous['data']) != self._rank_signature(snapshot):
+            self.stats["rank_changes"] += 1
+            ttl = max(self.min_ttl, ttl / 2)
+        else:
+            self.stats["rank_unchanged"] += 1
+            ttl = min(self.max_ttl, ttl * 1.5)
+        return ttl.total_seconds()
+    
+    def _get_age(self, entry: Dict[str, Any]) -> timedelta:
+        """エントリの経過時間を取得"""
+        cached_time = datetime.fromisoformat(entry.get('timestamp', '2000-01-01'))
+        return datetime.now() - cached_time
+    
+    def _mark_changed(self, player_key: str):
+        """エントリの変更を記録して書き込みをスケジュール"""
+        self._changed.add(player_key)
+        self._removed.discard(player_key)
+        self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """変更をまとめてディスクに書き込むようにスケジュール"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+    
+    async def _delayed_flush(self):
+        """一定時間待ってから変更をまとめて書き込む"""
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+    
+    async def flush(self):
+        """メモリ上の変更を保存先に書き込む"""
+        if not self._changed and not self._removed and not self._unsaved:
+            return
+        entries = {key: self._entries[key] for key in self._changed if key in self._entries}
+        unsaved = self._unsaved
+        entries.update(unsaved)
+        changed = {key: {**entry, 'data': entry['data'].to_dict()} for key, entry in entries.items()}
+        removed = list(self._removed)
+        self._changed = set()
+        self._removed = set()
+        self._unsaved = {}
+        try:
+            await self.storage.save_rank_entries(changed, removed)
+            self.stats["flushes"] += 1
+        except Exception as e:
+            # 失敗した分は次回の書き込みに回す
+            self._changed.update(key for key in changed if key in self._entries)
+            for key, entry in unsaved.items():
+                if key in self._evicted:
+                    self._unsaved.setdefault(key, entry)
+            self._removed.update(removed)
+            print(f"Error writing rank cache: {e}")
+    
+    async def close(self):
+        """保留中の書き込みを完了させる"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+    
+    async def get_player_entry(self, player_key: str) -> Optional[Tuple[RankSnapshot, float, bool]]:
+        """プレイヤーのキャッシュデータ・経過秒数・そのプレイヤーのTTL内かを取得（stale-while-revalidate用）
+        データにはfetched_at（取得時刻）が含まれる
+        """
+        await self._ensure_loaded()
+        await self._reload_evicted(player_key)
+        entry = self._get_entry(player_key)
+        if entry is None:
+            self.stats["misses"] += 1
+            return None
         
-        with open(queue_path, 'r', encoding='utf-8') as f:
-            retry_queue = json.load(f)
-        
-        player_key = f"{player_info['name']}#{player_info['tag']}"
-        
-        for entry in retry_queue:
-            if f"{entry['player']['name']}#{entry['player']['tag']}" == player_key:
-                entry['attempts'] += 1
-                entry['retry_at'] = (datetime.now() + timedelta(minutes=2)).isoformat()
-                break
-        
-        with open(queue_path, 'w', encoding='utf-8') as f:
-            json.dump(retry_queue, f, ensure_ascii=False, indent=2)
-    
-    async def get_all_cached_data(self, guild_id: str) -> Dict[str, Any]:
-        """すべてのキャッシュデータを取得（古いデータも含む）"""
-        cache = await self.load_cache(guild_id)
-        result = {}
-        for player_key, cached_data in cache.items():
-            if 'data' in cached_data:
-                result[player_key] = cached_data['data']
-        return result
\ No newline at end of file
+        age = self._get_age(entry)
+        fresh = age < self._get_ttl(entry)
+        self.stats["hits" if fresh else "stale_hits"] += 1
+        snapshot = entry['data']
+        if snapshot.fetched_at is None:
+            snapshot.fetched_at = entry.get('timestamp')
+        return snapshot, age.total_seconds(), fresh
+    
+    async def get_expires_at(self, player_key: str) -> Optional[float]:
+        """ソフトTTLが切れる時刻（UNIX時刻）を取得（統計には数えない）"""
+        await self._ensure_loaded()
+        await self._reload_evicted(player_key)
+        entry = self._entries.get(player_key)
+        if entry is None:
+            return None
+        cached_time = datetime.fromisoformat(entry.get('timestamp', '2000-01-01'))
+        return (cached_time + self._get_ttl(entry)).timestamp()
+    
+    def can_serve_stale(self, age_seconds: float) -> bool:
+        """ハードTTL内で、更新待ちの間そのまま表示してよいデータか
+        TTLを伸ばしたプレイヤーでも期限切れ直後は表示できるよう、最大TTLより短くはしない
+        """
+        return age_seconds < max(self.hard_ttl, self.max_ttl).total_seconds()
+    
+    async def update_player_data(self, player_key: str, snapshot: RankSnapshot):
+        """プレイヤーのデータを更新"""
+        await self._ensure_loaded()
+        await self._reload_evicted(player_key)  # TTLの調整に前回のデータを使う
+        self._not_found.pop(player_key, None)
+        now = datetime.now().isoformat()
+        snapshot.fetched_at = now
+        self._entries[player_key] = {
+            'data': snapshot,
+            'timestamp': now,
+            'last_update_attempt': now,
+            'ttl': self._next_ttl(self._entries.get(player_key), snapshot)
+        }
+        self._entries.move_to_end(player_key)
+        self._index_riot_id(player_key, self._entries[player_key])
+        self._mark_changed(player_key)
+        self._evict()
+        for listener in self._listeners:
+            listener(player_key, snapshot)
+    
+    def mark_not_found(self, player_key: str):
+        """APIで見つからなかったプレイヤーを記録（ネガティブキャッシュ）"""
+        self._not_found[player_key] = datetime.now() + self.not_found_ttl
+    
+    def is_not_found(self, player_key: str) -> bool:
+        """見つからなかった記録が期限内か"""
+        expires_at = self._not_found.get(player_key)
+        if expires_at is None:
+            return False
+        if datetime.now() >= expires_at:
+            del self._not_found[player_key]
+            return False
+        self.stats["not_found_hits"] += 1
+        return True
+    
+    async def mark_update_failed(self, player_key: str):
+        """更新失敗をマーク（前のデータを保持）"""
+        await self._ensure_loaded()
+        await self._reload_evicted(player_key)
+        entry = self._entries.get(player_key)
+        if entry:
+            entry['last_update_attempt'] = datetime.now().isoformat()
+            entry['failed_attempts'] = entry.get('failed_attempts', 0) + 1
+            self._mark_changed(player_key)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """キャッシュの統計情報を取得"""
+        lookups = self.stats["hits"] + self.stats["stale_hits"] + self.stats["misses"]
+        ttls = [self._get_ttl(entry).total_seconds() for entry in self._entries.values()]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "not_found_entries": len(self._not_found),
+            "avg_ttl_minutes": round(sum(ttls) / len(ttls) / 60, 1) if ttls else 0.0,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else 0.0
+        }
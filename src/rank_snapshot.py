@@ -0,0 +1,93 @@
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+# ティア名 -> ティアID（APIのcompetitive tier、0はUnrated）
+TIER_IDS = {
+    "Radiant": 27,
+    "Immortal 3": 26, "Immortal 2": 25, "Immortal 1": 24,
+    "Ascendant 3": 23, "Ascendant 2": 22, "Ascendant 1": 21,
+    "Diamond 3": 20, "Diamond 2": 19, "Diamond 1": 18,
+    "Platinum 3": 17, "Platinum 2": 16, "Platinum 1": 15,
+    "Gold 3": 14, "Gold 2": 13, "Gold 1": 12,
+    "Silver 3": 11, "Silver 2": 10, "Silver 1": 9,
+    "Bronze 3": 8, "Bronze 2": 7, "Bronze 1": 6,
+    "Iron 3": 5, "Iron 2": 4, "Iron 1": 3,
+    "Unrated": 0
+}
+
+# ソートキーでティアIDに掛ける値（Radiantでも超えないRRの上限）
+RR_SCALE = 100000
+
+@dataclass
+class RankSnapshot:
+    """リーダーボード・/rankの表示に必要な分だけを取り出したランク情報
+
+    APIのMMRレスポンス（シーズン履歴などを含む）は取得直後にこの形へ変換し、
+    キャッシュ・ソート・表示はすべてこれを使う。
+    """
+
+    __slots__ = ("name", "tag", "puuid", "region", "tier", "tier_name", "rr",
+                 "peak_tier", "peak_tier_name", "peak_rr", "leaderboard_rank", "fetched_at")
+
+    name: str
+    tag: str
+    puuid: Optional[str]
+    region: Optional[str]
+    tier: int  # 現在のティアID
+    tier_name: str
+    rr: int
+    peak_tier: int  # 最高到達ティアID
+    peak_tier_name: Optional[str]
+    peak_rr: int
+    leaderboard_rank: Optional[int]  # ランクリーダーボードの順位（圏外はNone）
+    fetched_at: Optional[str]  # 取得時刻（ISO形式）
+
+    @staticmethod
+    def _parse_tier(rank: Dict) -> tuple:
+        """current/peakのtierから(ティアID, ティア名)を取得"""
+        tier = rank.get("tier") or {}
+        name = tier.get("name")
+        tier_id = tier.get("id")
+        if tier_id is None:
+            tier_id = TIER_IDS.get(name, 0)
+        return int(tier_id), name
+
+    @classmethod
+    def from_api(cls, name: str, tag: str, region: Optional[str], data: Dict,
+                 fetched_at: Optional[str] = None) -> "RankSnapshot":
+        """v3 MMRレスポンスのdataから作成"""
+        current = data.get("current") or {}
+        peak = data.get("peak") or {}
+        tier, tier_name = cls._parse_tier(current)
+        peak_tier, peak_tier_name = cls._parse_tier(peak)
+        placement = current.get("leaderboard_placement") or {}
+        return cls(
+            name=name,
+            tag=tag,
+            puuid=(data.get("account") or {}).get("puuid"),
+            region=region,
+            tier=tier,
+            tier_name=tier_name or "Unrated",
+            rr=int(current.get("rr") or 0),
+            peak_tier=peak_tier,
+            peak_tier_name=peak_tier_name,
+            peak_rr=int(peak.get("rr") or 0),
+            leaderboard_rank=placement.get("rank"),
+            fetched_at=fetched_at
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "RankSnapshot":
+        """保存済みのデータから作成（以前のAPIレスポンスそのままの形式にも対応）"""
+        if "current" in data or "peak" in data:
+            return cls.from_api(data.get("name"), data.get("tag"), data.get("region"), data, data.get("fetched_at"))
+        return cls(**{field: data.get(field) for field in cls.__slots__})
+
+    @property
+    def sort_key(self) -> int:
+        """順位付け用の整数キー（ティアIDが上位、同じティア内はRR）"""
+        return self.tier * RR_SCALE + min(max(self.rr, 0), RR_SCALE - 1)
+
+    def to_dict(self) -> Dict:
+        """保存用の辞書に変換"""
+        return asdict(self)
@@ -0,0 +1,216 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Deque, Dict, Hashable, List, Optional, Mapping
+
+class Priority(IntEnum):
+    """APIリクエストの優先度（小さいほど先に送る）"""
+    INTERACTIVE = 0  # /rankなどユーザーが待っているコマンド
+    REGISTRATION = 1  # /register
+    LEADERBOARD = 2  # /leaderboardの表示
+    AUTO_UPDATE = 3  # 自動更新
+    BACKGROUND = 4  # 再試行・プリフェッチ
+
+class _Waiter:
+    """トークン待ちのリクエスト"""
+
+    __slots__ = ("priority", "enqueued_at", "seq", "tag", "future")
+
+    def __init__(self, priority: int, enqueued_at: float, seq: int, tag: Optional[Hashable],
+                 future: asyncio.Future):
+        self.priority = priority
+        self.enqueued_at = enqueued_at
+        self.seq = seq
+        self.tag = tag  # 優先度を引き上げる時にリクエストを特定するキー
+        self.future = future
+
+class RateLimiter:
+    """プロセス全体で共有するトークンバケット方式のAPIリクエストスケジューラ
+
+    Henrik APIのレート制限ヘッダー（x-ratelimit-*, Retry-After）を読み取り、
+    予算を超えないようにリクエストを一定間隔に整列させる。
+    トークンがない場合は呼び出し側を失敗させずに待機させる。
+
+    待機中のリクエストは優先度順にトークンを受け取る。自動更新・再試行などの
+    バックグラウンドのリクエストはreserved_tokens分のトークンを残して待つため、
+    コマンドのリクエストはすぐに送れる。待ち時間がaging_seconds経つごとに
+    優先度を1段階ずつ上げ、バックグラウンドのリクエストも取り残されないようにする。
+    """
+
+    def __init__(self, requests_per_minute: int = 30, safety_margin: float = 0.9, burst: int = 3,
+                 reserved_tokens: int = 1, aging_seconds: float = 15):
+        self.requests_per_minute = requests_per_minute
+        self.safety_margin = safety_margin  # 制限ギリギリを避けるための係数
+        self.burst = burst
+        self.reserved_tokens = reserved_tokens  # コマンド用に残しておくトークン数
+        self.aging_seconds = aging_seconds  # 優先度を1段階上げるまでの待ち時間
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0  # 429/残量0の場合の待機終了時刻
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+        # 統計情報
+        self.acquired_count = 0
+        self.throttled_count = 0  # 429を受けた回数
+        self.total_wait_time = 0.0
+        self.aged_count = 0  # 待ち時間で優先度が上がってから送れたリクエスト数
+        self._lane_stats = {priority: {"acquired": 0, "total_wait_time": 0.0} for priority in Priority}
+        self._lane_waits: Dict[int, Deque[float]] = {priority: deque(maxlen=200) for priority in Priority}
+
+    @property
+    def rate(self) -> float:
+        """1秒あたりに補充されるトークン数"""
+        return self.requests_per_minute * self.safety_margin / 60
+
+    @property
+    def capacity(self) -> int:
+        """バケットの最大トークン数"""
+        return max(1, min(self.burst, int(self.requests_per_minute * self.safety_margin)))
+
+    def _refill(self, now: float):
+        """経過時間に応じてトークンを補充"""
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def _effective_priority(self, waiter: _Waiter, now: float) -> float:
+        """待ち時間を考慮した優先度"""
+        return waiter.priority - (now - waiter.enqueued_at) / self.aging_seconds
+
+    def _required_tokens(self, effective_priority: float) -> float:
+        """送信に必要なトークン数（バケットに残す予約分を含む）"""
+        if effective_priority < Priority.LEADERBOARD:
+            return 1
+        return 1 + min(self.reserved_tokens, self.capacity - 1)
+
+    def _dispatch(self):
+        """優先度の高い順に待機中のリクエストへトークンを渡す"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiters:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                self._schedule_dispatch(self.blocked_until - now)
+                return
+
+            self._refill(now)
+            waiter = min(self._waiters, key=lambda w: (self._effective_priority(w, now), w.seq))
+            if waiter.future.done():
+                # キャンセルされたがまだacquireに戻っていない待機者はトークンを渡さずに外す
+                self._waiters.remove(waiter)
+                continue
+            effective_priority = self._effective_priority(waiter, now)
+            required = self._required_tokens(effective_priority)
+            if self.tokens < required:
+                self._schedule_dispatch((required - self.tokens) / self.rate)
+                return
+
+            self.tokens -= 1
+            self._waiters.remove(waiter)
+            if effective_priority <= waiter.priority - 1:
+                self.aged_count += 1
+            waiter.future.set_result(None)
+
+    def _schedule_dispatch(self, delay: float):
+        """delay秒後に再度トークンを配る"""
+        self._timer = asyncio.get_running_loop().call_later(max(delay, 0.001), self._dispatch)
+
+    async def acquire(self, priority: int = Priority.BACKGROUND, tag: Optional[Hashable] = None):
+        """リクエスト送信の許可を待つ（優先度順、同じ優先度なら到着順に待機させる）"""
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(int(priority), started_at, next(self._seq), tag, future)
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 受け取ったトークンは使わずに戻す
+                self.tokens = min(self.capacity, self.tokens + 1)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._dispatch()
+            raise
+
+        wait_time = time.monotonic() - started_at
+        self.acquired_count += 1
+        self.total_wait_time += wait_time
+        lane = self._lane_stats[waiter.priority]
+        lane["acquired"] += 1
+        lane["total_wait_time"] += wait_time
+        self._lane_waits[waiter.priority].append(wait_time)
+
+    def raise_priority(self, tag: Hashable, priority: int):
+        """tagで待機中のリクエストの優先度を引き上げる（相乗りしたリクエストの方が急ぎの場合）"""
+        for waiter in self._waiters:
+            if waiter.tag == tag and priority < waiter.priority:
+                waiter.priority = int(priority)
+        self._dispatch()
+
+    def update_from_headers(self, status: int, headers: Mapping[str, str]):
+        """レスポンスのレート制限ヘッダーから予算を更新"""
+        now = time.monotonic()
+        limit = self._parse_number(headers.get("x-ratelimit-limit"))
+        remaining = self._parse_number(headers.get("x-ratelimit-remaining"))
+        reset = self._parse_number(headers.get("x-ratelimit-reset"))
+        retry_after = self._parse_number(headers.get("Retry-After"))
+
+        # APIキーの実際の上限に合わせる
+        if limit and int(limit) != self.requests_per_minute:
+            self.requests_per_minute = int(limit)
+            self.tokens = min(self.tokens, self.capacity)
+
+        if remaining is not None:
+            # サーバー側の残量より多くのトークンを持たない
+            self._refill(now)
+            self.tokens = min(self.tokens, max(0.0, remaining - 1))
+            if remaining <= 0 and reset:
+                self.blocked_until = max(self.blocked_until, now + reset)
+
+        if status == 429:
+            self.throttled_count += 1
+            wait = retry_after or reset or 60 / max(1, self.requests_per_minute)
+            self.blocked_until = max(self.blocked_until, now + wait)
+            self.tokens = 0.0
+
+    def _parse_number(self, value: Optional[str]) -> Optional[float]:
+        """ヘッダー値を数値に変換"""
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def get_stats(self) -> Dict:
+        """スケジューラの統計情報を取得"""
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens": round(self.tokens, 2),
+            "blocked_for": max(0.0, round(self.blocked_until - time.monotonic(), 2)),
+            "acquired": self.acquired_count,
+            "throttled": self.throttled_count,
+            "total_wait_time": round(self.total_wait_time, 2),
+            "waiting": len(self._waiters),
+            "aged": self.aged_count,
+            "lanes": {priority.name.lower(): self._get_lane_stats(priority) for priority in Priority}
+        }
+
+    def _get_lane_stats(self, priority: Priority) -> Dict:
+        """優先度ごとの待ち時間の統計情報を取得"""
+        lane = self._lane_stats[priority]
+        waits = sorted(self._lane_waits[priority])
+        return {
+            "acquired": lane["acquired"],
+            "waiting": sum(1 for waiter in self._waiters if waiter.priority == priority),
+            "avg_wait": round(lane["total_wait_time"] / lane["acquired"], 3) if lane["acquired"] else 0.0,
+            "p95_wait": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0
+        }
@@ -1,87 +1,199 @@
 import asyncio
-from typing import Dict, List
-from datetime import datetime
-from .rank_cache import RankCache
+import heapq
+import os
+import random
+import time
+from typing import Dict, List, Optional, Tuple
 from .valorant_api import ValorantAPI
+from .circuit_breaker import CircuitOpenError
 
 class RetryManager:
-    """API失敗時の再試行を管理するクラス"""
-    
-    def __init__(self, api_key: str):
-        self.cache = RankCache()
-        self.api = ValorantAPI(api_key)
-        self.retry_tasks = {}  # guild_id -> task
-    
-    async def start_retry_loop(self, guild_id: str):
-        """ギルドごとの再試行ループを開始"""
-        if guild_id in self.retry_tasks:
-            # 既に実行中の場合はスキップ
-            return
-        
-        self.retry_tasks[guild_id] = asyncio.create_task(self._retry_loop(guild_id))
-    
-    async def stop_retry_loop(self, guild_id: str):
-        """ギルドごとの再試行ループを停止"""
-        if guild_id in self.retry_tasks:
-            self.retry_tasks[guild_id].cancel()
-            del self.retry_tasks[guild_id]
-    
-    async def _retry_loop(self, guild_id: str):
-        """2分ごとに再試行キューをチェック"""
-        while True:
+    """API失敗時の再試行を管理するクラス
+
+    全ギルド共通の1つのスケジューラで、retry_at順のヒープから次の再試行時刻まで
+    正確にスリープする。同じプレイヤー（puuid）はギルドをまたいで1件にまとめ、
+    失敗するたびに指数バックオフ＋ジッターで次回時刻を決める。
+    """
+
+    def __init__(self, api: ValorantAPI):
+        self.api = api  # Bot共有のAPIクライアント
+        self.cache = api.cache
+        self.storage = api.cache.storage
+        self.base_delay = float(os.getenv('RETRY_BASE_DELAY', '120'))  # 初回の再試行までの秒数
+        self.max_delay = float(os.getenv('RETRY_MAX_DELAY', '1800'))  # バックオフの上限秒数
+        self.max_attempts = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))  # 最大再試行回数
+        self.default_region = os.getenv('DEFAULT_REGION', 'ap')  # 地域が未登録のプレイヤー用
+
+        self._entries: Dict[str, Dict] = {}  # player_key -> 再試行エントリ
+        self._heap: List[Tuple[float, str]] = []  # (retry_at, player_key)
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self._stopped = False  # stop_all後（終了処理中）は再開しない
+        self._save_lock = asyncio.Lock()  # スナップショットの書き込みを直列化
+
+        # 統計情報
+        self.stats = {"scheduled": 0, "succeeded": 0, "failed": 0, "dropped": 0}
+
+    def _get_delay(self, attempts: int) -> float:
+        """試行回数に応じたバックオフ時間（ジッター付き）を取得"""
+        delay = min(self.max_delay, self.base_delay * (2 ** attempts))
+        return delay * random.uniform(0.8, 1.2)
+
+    def _push(self, player_key: str, entry: Dict):
+        """エントリをヒープに登録し、先頭が変わった場合はスケジューラを起こす"""
+        heapq.heappush(self._heap, (entry['retry_at'], player_key))
+        if self._heap[0][1] == player_key:
+            self._wakeup.set()
+
+    async def start(self):
+        """保存済みのキューを読み込んで再試行スケジューラを開始"""
+        self._stopped = False
+        if not self._loaded:
+            for entry in await self.storage.load_retry_entries():
+                player_key = self.cache.player_key(entry['player'])
+                self._entries[player_key] = entry
+                self._push(player_key, entry)
+            self._loaded = True
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop_all(self):
+        """再試行スケジューラを停止してキューを保存"""
+        self._stopped = True
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._loaded:
+            await self._save()
+
+    async def _save(self):
+        """キューのスナップショットを保存先に書き込む
+        同時に呼ばれても古いスナップショットが新しいものを上書きしないよう、
+        ロックを取ってからその時点のキューを書き込む
+        """
+        async with self._save_lock:
             try:
-                await asyncio.sleep(120)  # 2分待機
-                await self.process_retry_queue(guild_id)
-            except asyncio.CancelledError:
-                break
+                await self.storage.save_retry_entries(list(self._entries.values()))
             except Exception as e:
-                print(f"Error in retry loop for guild {guild_id}: {e}")
-    
-    async def process_retry_queue(self, guild_id: str):
-        """再試行キューを処理"""
-        retry_entries = await self.cache.get_retry_queue(guild_id)
-        
-        if not retry_entries:
-            return
-        
-        print(f"Processing {len(retry_entries)} retry entries for guild {guild_id}")
-        
-        for entry in retry_entries:
-            player = entry['player']
-            player_key = f"{player['name']}#{player['tag']}"
-            
+                print(f"Error saving retry queue: {e}")
+
+    async def _run(self):
+        """次の再試行時刻まで待機して、期限が来たエントリを処理"""
+        while True:
             try:
-                # デフォルトリージョンを使用（または設定から取得）
-                region = "ap"  # TODO: ギルドごとの設定から取得
-                
-                # APIから再取得を試みる
-                rank_data = await self.api.get_player_rank(region, player["name"], player["tag"])
-                result = {
-                    "name": player["name"],
-                    "tag": player["tag"],
-                    **rank_data["data"]
-                }
-                
-                # キャッシュを更新
-                await self.cache.update_player_data(guild_id, player_key, result)
-                print(f"Successfully updated data for {player_key}")
-                
-                # 成功したので再試行は不要
-                await self.cache.update_retry_attempt(guild_id, player, success=True)
-                
+                self._wakeup.clear()
+                now = time.time()
+                due = []
+                while self._heap and self._heap[0][0] <= now:
+                    retry_at, player_key = heapq.heappop(self._heap)
+                    entry = self._entries.get(player_key)
+                    # 削除済み・再スケジュール済みのエントリは無視
+                    if entry is not None and entry['retry_at'] == retry_at:
+                        due.append((player_key, entry))
+
+                if due:
+                    await asyncio.gather(*(self._process(player_key, entry) for player_key, entry in due))
+                    await self._save()
+                    continue
+
+                timeout = self._heap[0][0] - now if self._heap else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print(f"Retry failed for {player_key}: {e}")
-                # 失敗した場合、次の再試行をスケジュール
-                await self.cache.update_retry_attempt(guild_id, player, success=False)
-    
-    async def immediate_retry(self, guild_id: str, failed_players: List[Dict]):
-        """即座に再試行を実行（初回失敗時用）"""
-        if not failed_players:
+                print(f"Error in retry scheduler: {e}")
+                await asyncio.sleep(5)
+
+    async def _process(self, player_key: str, entry: Dict):
+        """1件の再試行を実行"""
+        player = entry['player']
+        player_label = f"{player['name']}#{player['tag']}"
+
+        try:
+            # 登録時の地域で再取得を試みる
+            region = player.get("region") or self.default_region
+            result = await self.api.fetch_player_rank(player, region)
+
+            # キャッシュを更新
+            await self.cache.update_player_data(player_key, result)
+            print(f"Successfully updated data for {player_label}")
+
+            # 成功したので再試行は不要
+            self._entries.pop(player_key, None)
+            self.stats["succeeded"] += 1
+
+        except ValueError as e:
+            # 見つからないプレイヤー（名前変更・削除）は再試行しない
+            print(f"Dropping retry for {player_label}: {e}")
+            self._entries.pop(player_key, None)
+            self.stats["dropped"] += 1
+
+        except CircuitOpenError:
+            # API障害中は試行回数を増やさずに待つ
+            entry['retry_at'] = time.time() + self._get_delay(entry['attempts'])
+            self._push(player_key, entry)
+
+        except Exception as e:
+            print(f"Retry failed for {player_label}: {e}")
+            self.stats["failed"] += 1
+            entry['attempts'] += 1
+
+            if entry['attempts'] >= self.max_attempts:
+                # 最大回数に達したら諦める
+                self._entries.pop(player_key, None)
+                self.stats["dropped"] += 1
+                return
+
+            # 失敗した場合、バックオフして次の再試行をスケジュール
+            entry['retry_at'] = time.time() + self._get_delay(entry['attempts'])
+            self._push(player_key, entry)
+
+    async def schedule(self, guild_id: str, failed_players: List[Dict]):
+        """失敗したプレイヤーの再試行をスケジュール（puuidで重複を排除）"""
+        if not failed_players or self._stopped:
             return
-        
-        # 2分後に再試行をスケジュール
+
+        if not self._loaded or self._task is None:
+            await self.start()
+
+        changed = False
         for player in failed_players:
-            await self.cache.add_to_retry_queue(guild_id, player)
-        
-        # 再試行ループが開始されていない場合は開始
-        await self.start_retry_loop(guild_id)
\ No newline at end of file
+            player_key = self.cache.player_key(player)
+            if self.cache.is_not_found(player_key):
+                continue  # 見つからないプレイヤーは再試行しても無駄
+            entry = self._entries.get(player_key)
+            if entry is not None:
+                # 既にキューにいる場合は参照元のギルドだけ追加
+                if guild_id not in entry['guild_ids']:
+                    entry['guild_ids'].append(guild_id)
+                    changed = True
+                continue
+
+            entry = {
+                'player': player,
+                'guild_ids': [guild_id],
+                'retry_at': time.time() + self._get_delay(0),
+                'attempts': 0
+            }
+            self._entries[player_key] = entry
+            self._push(player_key, entry)
+            self.stats["scheduled"] += 1
+            changed = True
+
+        if changed:
+            await self._save()
+
+    def get_stats(self) -> Dict:
+        """再試行の統計情報を取得"""
+        next_retry = self._heap[0][0] - time.time() if self._heap else None
+        return {
+            **self.stats,
+            "queue_depth": len(self._entries),
+            "next_retry_in": round(next_retry, 1) if next_retry is not None else None
+        }
@@ -0,0 +1,16 @@
+# Storage Package
+import os
+from pathlib import Path
+from .base import Storage
+from .json_storage import JsonStorage
+from .sqlite_storage import SqliteStorage
+
+DEFAULT_DATA_DIR = Path(__file__).parent.parent.parent / "data"
+
+def create_storage() -> Storage:
+    """環境変数STORAGE_BACKENDに応じて保存先を作成（json / sqlite）"""
+    backend = os.getenv('STORAGE_BACKEND', 'json').lower()
+    if backend == 'sqlite':
+        db_path = os.getenv('SQLITE_PATH', str(DEFAULT_DATA_DIR / "valorantbot.db"))
+        return SqliteStorage(Path(db_path))
+    return JsonStorage(DEFAULT_DATA_DIR, flush_delay=float(os.getenv('DATA_FLUSH_DELAY', '1')))
@@ -0,0 +1,73 @@
+from typing import Dict, List, Optional, Iterable, Any
+
+class Storage:
+    """データ保存先の共通インターフェース
+    プレイヤー登録・ランクキャッシュ・再試行キュー・自動更新設定を扱う
+    """
+
+    async def close(self):
+        """保存先を閉じる"""
+        pass
+
+    # ---- プレイヤー登録 ----
+
+    async def list_guild_ids(self) -> List[str]:
+        """データが存在するギルドIDの一覧を取得"""
+        raise NotImplementedError
+
+    async def get_guild_players(self, guild_id: str) -> Dict[str, Dict]:
+        """ギルドの登録プレイヤーを取得（キー -> プレイヤーデータ）"""
+        raise NotImplementedError
+
+    async def upsert_player(self, guild_id: str, puuid: str, player_data: Dict):
+        """プレイヤーを追加または更新"""
+        raise NotImplementedError
+
+    async def delete_player(self, guild_id: str, puuid: str) -> bool:
+        """プレイヤーを削除"""
+        raise NotImplementedError
+
+    # ---- 自動更新設定 ----
+
+    async def get_auto_update_config(self, guild_id: str) -> Optional[Dict]:
+        """ギルドの自動更新設定を取得"""
+        raise NotImplementedError
+
+    async def set_auto_update_config(self, guild_id: str, config: Dict):
+        """ギルドの自動更新設定を保存"""
+        raise NotImplementedError
+
+    async def get_all_auto_update_configs(self) -> Dict[str, Dict]:
+        """すべてのギルドの自動更新設定を取得"""
+        raise NotImplementedError
+
+    async def get_enabled_auto_update_configs(self) -> Dict[str, Dict]:
+        """自動更新が有効なギルドの設定だけを取得"""
+        return {
+            guild_id: config for guild_id, config in (await self.get_all_auto_update_configs()).items()
+            if config.get("enabled")
+        }
+
+    # ---- ランクキャッシュ ----
+
+    async def load_rank_entries(self) -> Dict[str, Dict[str, Any]]:
+        """ランクキャッシュの全エントリを読み込む"""
+        raise NotImplementedError
+
+    async def load_rank_entry(self, player_key: str) -> Optional[Dict[str, Any]]:
+        """ランクキャッシュのエントリを1件読み込む（なければNone）"""
+        raise NotImplementedError
+
+    async def save_rank_entries(self, changed: Dict[str, Dict[str, Any]], removed: Iterable[str]):
+        """変更・削除されたランクキャッシュのエントリを保存"""
+        raise NotImplementedError
+
+    # ---- 再試行キュー ----
+
+    async def load_retry_entries(self) -> List[Dict]:
+        """全ギルド共通の再試行キューを読み込む"""
+        raise NotImplementedError
+
+    async def save_retry_entries(self, entries: List[Dict]):
+        """全ギルド共通の再試行キューのスナップショットを保存"""
+        raise NotImplementedError
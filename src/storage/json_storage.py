@@ -0,0 +1,249 @@
+import json
+import os
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Optional, Iterable, Any
+from .base import Storage
+
+class JsonStorage(Storage):
+    """既存のdata/*.jsonレイアウトを使う保存先
+
+    ギルドファイルは初回読み込み後メモリに保持し、変更は一定時間まとめてから
+    一時ファイル＋renameで原子的に書き込む。ファイルI/Oはスレッドプールで実行する。
+    """
+
+    def __init__(self, data_dir: Path, flush_delay: float = 1.0):
+        self.data_dir = Path(data_dir)
+        self.cache_dir = self.data_dir / "cache"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.flush_delay = flush_delay  # 変更をまとめて書き込むまでの待機秒数
+        self._guilds: Dict[str, Dict] = {}  # guild_id -> ギルドファイルの内容
+        self._dirty_guilds = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self._write_locks: Dict[Path, asyncio.Lock] = {}  # ファイルごとの書き込みを直列化
+        self._rank_entries: Optional[Dict[str, Dict[str, Any]]] = None
+        self._auto_update_configs: Optional[Dict[str, Dict]] = None  # guild_id -> 自動更新設定
+        self._auto_update_dirty = False
+        self._auto_update_lock = asyncio.Lock()
+
+    def _get_guild_file_path(self, guild_id: str) -> Path:
+        """ギルドのデータファイルパスを取得"""
+        return self.data_dir / f"{guild_id}.json"
+
+    def _get_rank_store_path(self) -> Path:
+        """全ギルド共通のランクストアのファイルパスを取得"""
+        return self.cache_dir / "rank_store.json"
+
+    def _get_auto_update_index_path(self) -> Path:
+        """全ギルドの自動更新設定をまとめた索引のファイルパスを取得"""
+        return self.cache_dir / "auto_update_configs.json"
+
+    def _get_retry_queue_path(self) -> Path:
+        """全ギルド共通の再試行キューファイルパスを取得"""
+        return self.cache_dir / "retry_queue.json"
+
+    def _read_json(self, file_path: Path, default):
+        """JSONファイルを読み込む（存在しない・壊れている場合はdefault）"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+    def _write_text(self, file_path: Path, text: str):
+        """一時ファイルに書き込んでからrenameで置き換える（途中で落ちてもファイルが壊れない）"""
+        fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=file_path.name + ".", suffix=".tmp")
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    async def _read_json_async(self, file_path: Path, default):
+        """JSONファイルをスレッドプールで読み込む"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._read_json, file_path, default)
+
+    async def _write_json_async(self, file_path: Path, data, indent: Optional[int] = 2):
+        """JSONファイルをスレッドプールで書き込む
+        同じファイルへの書き込みは順番に行い、後から呼ばれた方の内容が必ず残るようにする
+        シリアライズはイベントループ上で行い、書き込み中の変更と競合しないようにする
+        """
+        lock = self._write_locks.get(file_path)
+        if lock is None:
+            lock = self._write_locks[file_path] = asyncio.Lock()
+        async with lock:
+            text = json.dumps(data, ensure_ascii=False, indent=indent)
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_text, file_path, text)
+
+    async def _load_guild(self, guild_id: str) -> Dict:
+        """ギルドデータを取得（初回のみファイルから読み込む）"""
+        guild_data = self._guilds.get(guild_id)
+        if guild_data is None:
+            loaded = await self._read_json_async(self._get_guild_file_path(guild_id), {})
+            # 読み込み中に別のタスクが先に読み込んだ場合はそちらを使う
+            guild_data = self._guilds.setdefault(guild_id, loaded)
+        return guild_data
+
+    async def _load_auto_update_index(self) -> Dict[str, Dict]:
+        """自動更新設定の索引を取得（初回のみ読み込み、なければギルドファイルから作成）"""
+        if self._auto_update_configs is not None:
+            return self._auto_update_configs
+
+        async with self._auto_update_lock:
+            if self._auto_update_configs is None:
+                configs = await self._read_json_async(self._get_auto_update_index_path(), None)
+                if configs is None:
+                    # 索引がない場合（以前のレイアウト）は全ギルドファイルから1度だけ作成する
+                    configs = {}
+                    for guild_id in await self.list_guild_ids():
+                        auto_update = (await self._load_guild(guild_id)).get("auto_update")
+                        if auto_update:
+                            configs[guild_id] = auto_update
+                    self._auto_update_dirty = True
+                self._auto_update_configs = configs
+                if self._auto_update_dirty:
+                    self._mark_dirty()
+        return self._auto_update_configs
+
+    def _mark_dirty(self):
+        """書き込みをスケジュール"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    def _mark_guild_dirty(self, guild_id: str):
+        """ギルドデータの変更を記録して書き込みをスケジュール"""
+        self._dirty_guilds.add(guild_id)
+        self._mark_dirty()
+
+    async def _delayed_flush(self):
+        """一定時間待ってから変更をまとめて書き込む"""
+        await asyncio.sleep(self.flush_delay)
+        await self.flush()
+
+    async def flush(self):
+        """変更されたギルドファイルと自動更新設定の索引を書き込む"""
+        async with self._flush_lock:
+            if self._auto_update_dirty:
+                self._auto_update_dirty = False
+                try:
+                    await self._write_json_async(self._get_auto_update_index_path(), self._auto_update_configs)
+                except Exception as e:
+                    self._auto_update_dirty = True
+                    print(f"Error writing auto update index: {e}")
+
+            dirty_guilds = self._dirty_guilds
+            self._dirty_guilds = set()
+            for guild_id in dirty_guilds:
+                try:
+                    await self._write_json_async(self._get_guild_file_path(guild_id), self._guilds[guild_id])
+                except Exception as e:
+                    # 失敗した分は次回の書き込みに回す
+                    self._dirty_guilds.add(guild_id)
+                    print(f"Error writing guild data for {guild_id}: {e}")
+
+    async def close(self):
+        """保留中の書き込みを完了させる"""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self.flush()
+
+    # ---- プレイヤー登録 ----
+
+    async def list_guild_ids(self) -> List[str]:
+        """データが存在するギルドIDの一覧を取得"""
+        loop = asyncio.get_running_loop()
+        file_paths = await loop.run_in_executor(None, lambda: list(self.data_dir.glob("*.json")))
+        return sorted({file_path.stem for file_path in file_paths} | set(self._guilds))
+
+    async def get_guild_players(self, guild_id: str) -> Dict[str, Dict]:
+        """ギルドの登録プレイヤーを取得（キー -> プレイヤーデータ）"""
+        players = (await self._load_guild(guild_id)).get("players", {})
+        return {key: dict(player_data) for key, player_data in players.items()}
+
+    async def upsert_player(self, guild_id: str, puuid: str, player_data: Dict):
+        """プレイヤーを追加または更新"""
+        guild_data = await self._load_guild(guild_id)
+        guild_data.setdefault("players", {})[puuid] = dict(player_data)
+        self._mark_guild_dirty(guild_id)
+
+    async def delete_player(self, guild_id: str, puuid: str) -> bool:
+        """プレイヤーを削除"""
+        guild_data = await self._load_guild(guild_id)
+        players = guild_data.get("players", {})
+
+        # 古いデータはpuuid以外のキーで保存されている場合がある
+        key = puuid if puuid in players else next(
+            (k for k, p in players.items() if p.get("puuid") == puuid), None
+        )
+        if key is None:
+            return False
+
+        del players[key]
+        self._mark_guild_dirty(guild_id)
+        return True
+
+    # ---- 自動更新設定 ----
+
+    async def get_auto_update_config(self, guild_id: str) -> Optional[Dict]:
+        """ギルドの自動更新設定を取得"""
+        return (await self._load_guild(guild_id)).get("auto_update")
+
+    async def set_auto_update_config(self, guild_id: str, config: Dict):
+        """ギルドの自動更新設定を保存"""
+        guild_data = await self._load_guild(guild_id)
+        guild_data["auto_update"] = config
+        self._mark_guild_dirty(guild_id)
+
+        # 索引も更新する（ギルドファイルの設定は後方互換のため残す）
+        configs = await self._load_auto_update_index()
+        configs[guild_id] = config
+        self._auto_update_dirty = True
+        self._mark_dirty()
+
+    async def get_all_auto_update_configs(self) -> Dict[str, Dict]:
+        """すべてのギルドの自動更新設定を取得（索引から読むのでギルドファイルは開かない）"""
+        return dict(await self._load_auto_update_index())
+
+    # ---- ランクキャッシュ ----
+
+    async def load_rank_entries(self) -> Dict[str, Dict[str, Any]]:
+        """ランクキャッシュの全エントリを読み込む"""
+        self._rank_entries = await self._read_json_async(self._get_rank_store_path(), {})
+        return dict(self._rank_entries)
+
+    async def load_rank_entry(self, player_key: str) -> Optional[Dict[str, Any]]:
+        """ランクキャッシュのエントリを1件読み込む（なければNone）"""
+        if self._rank_entries is None:
+            await self.load_rank_entries()
+        return self._rank_entries.get(player_key)
+
+    async def save_rank_entries(self, changed: Dict[str, Dict[str, Any]], removed: Iterable[str]):
+        """変更・削除されたランクキャッシュのエントリを保存（ファイル全体を書き込む）"""
+        if self._rank_entries is None:
+            await self.load_rank_entries()
+        self._rank_entries.update(changed)
+        for player_key in removed:
+            self._rank_entries.pop(player_key, None)
+
+        await self._write_json_async(self._get_rank_store_path(), self._rank_entries, indent=None)
+
+    # ---- 再試行キュー ----
+
+    async def load_retry_entries(self) -> List[Dict]:
+        """全ギルド共通の再試行キューを読み込む"""
+        return await self._read_json_async(self._get_retry_queue_path(), [])
+
+    async def save_retry_entries(self, entries: List[Dict]):
+        """全ギルド共通の再試行キューのスナップショットを保存"""
+        await self._write_json_async(self._get_retry_queue_path(), entries)
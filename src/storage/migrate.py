@@ -0,0 +1,55 @@
+"""既存のdata/*.jsonレイアウトをSQLiteへ移行するスクリプト
+
+使い方: python -m src.storage.migrate [SQLiteファイルのパス]
+"""
+import os
+import sys
+import asyncio
+from pathlib import Path
+from . import DEFAULT_DATA_DIR
+from .base import Storage
+from .json_storage import JsonStorage
+from .sqlite_storage import SqliteStorage
+
+async def migrate(source: Storage, target: Storage) -> dict:
+    """sourceの全データをtargetへコピー"""
+    counts = {"players": 0, "auto_update_configs": 0, "rank_entries": 0, "retry_entries": 0}
+
+    for guild_id in await source.list_guild_ids():
+        for key, player_data in (await source.get_guild_players(guild_id)).items():
+            # 古いデータはpuuid以外のキーで保存されている場合がある
+            puuid = player_data.get("puuid") or key
+            await target.upsert_player(guild_id, puuid, {**player_data, "puuid": puuid})
+            counts["players"] += 1
+
+        config = await source.get_auto_update_config(guild_id)
+        if config:
+            await target.set_auto_update_config(guild_id, config)
+            counts["auto_update_configs"] += 1
+
+    rank_entries = await source.load_rank_entries()
+    await target.save_rank_entries(rank_entries, [])
+    counts["rank_entries"] = len(rank_entries)
+
+    retry_entries = await source.load_retry_entries()
+    await target.save_retry_entries(retry_entries)
+    counts["retry_entries"] = len(retry_entries)
+
+    return counts
+
+async def main():
+    """JSONからSQLiteへの一括移行を実行"""
+    db_path = Path(sys.argv[1] if len(sys.argv) > 1 else os.getenv('SQLITE_PATH', str(DEFAULT_DATA_DIR / "valorantbot.db")))
+    source = JsonStorage(DEFAULT_DATA_DIR)
+    target = SqliteStorage(db_path)
+    try:
+        counts = await migrate(source, target)
+    finally:
+        await target.close()
+
+    print(f"Migrated to {db_path}:")
+    for name, count in counts.items():
+        print(f"  {name}: {count}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,235 @@
+import json
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Iterable, Any
+from .base import Storage
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    guild_id TEXT NOT NULL,
+    puuid TEXT NOT NULL,
+    name TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    name_tag TEXT NOT NULL,
+    region TEXT,
+    discord_user_id TEXT,
+    updated_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (guild_id, puuid)
+);
+CREATE INDEX IF NOT EXISTS idx_players_puuid ON players (puuid);
+CREATE INDEX IF NOT EXISTS idx_players_discord_user ON players (guild_id, discord_user_id);
+CREATE INDEX IF NOT EXISTS idx_players_name_tag ON players (guild_id, name_tag);
+
+CREATE TABLE IF NOT EXISTS rank_cache (
+    player_key TEXT PRIMARY KEY,
+    timestamp TEXT,
+    entry TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS retry_queue (
+    player_key TEXT PRIMARY KEY,
+    retry_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    entry TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_retry_queue_retry_at ON retry_queue (retry_at);
+
+CREATE TABLE IF NOT EXISTS auto_update_configs (
+    guild_id TEXT PRIMARY KEY,
+    enabled INTEGER NOT NULL DEFAULT 0,
+    channel_id INTEGER,
+    message_id INTEGER,
+    config TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_auto_update_configs_enabled ON auto_update_configs (enabled);
+"""
+
+def _player_key(player: Dict) -> str:
+    """再試行エントリのキーを取得（RankCache.player_keyと同じ規則）"""
+    return player.get("puuid") or f"{player['name']}#{player['tag']}".lower()
+
+class SqliteStorage(Storage):
+    """SQLite（WALモード）を使う保存先
+    1件の更新は1行の書き込みで済み、ファイル全体の書き直しは発生しない
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()  # 接続はスレッドプールから共有して使う
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+            self._conn.commit()
+
+    def _migrate(self):
+        """古いスキーマのDBを一度だけ更新する（PRAGMA user_versionで適用済みかを記録）"""
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            # ギルドごとの再試行キュー（retry_entries）は全ギルド共通のretry_queueに置き換えた。
+            # 古いエントリはretry_atの形式も違うため引き継がず、失敗したプレイヤーは次回の取得で再登録される
+            self._conn.execute("DROP TABLE IF EXISTS retry_entries")
+            self._conn.execute("PRAGMA user_version = 1")
+
+    async def _run(self, func, *args):
+        """ブロッキングなDB操作をスレッドプールで実行"""
+        def locked():
+            with self._lock:
+                return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, locked)
+
+    def _execute(self, sql: str, params: Iterable = ()) -> sqlite3.Cursor:
+        """SQLを実行してコミット"""
+        cursor = self._conn.execute(sql, tuple(params))
+        self._conn.commit()
+        return cursor
+
+    def _executemany(self, statements: List[tuple]):
+        """複数のSQLを1トランザクションで実行"""
+        with self._conn:
+            for sql, params in statements:
+                self._conn.execute(sql, tuple(params))
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        """SQLを実行して全行を取得"""
+        return self._conn.execute(sql, tuple(params)).fetchall()
+
+    async def close(self):
+        """接続を閉じる"""
+        await self._run(self._conn.close)
+
+    # ---- プレイヤー登録 ----
+
+    async def list_guild_ids(self) -> List[str]:
+        """データが存在するギルドIDの一覧を取得"""
+        rows = await self._run(
+            self._query,
+            "SELECT guild_id FROM players UNION SELECT guild_id FROM auto_update_configs"
+        )
+        return [row["guild_id"] for row in rows]
+
+    async def get_guild_players(self, guild_id: str) -> Dict[str, Dict]:
+        """ギルドの登録プレイヤーを取得（キー -> プレイヤーデータ）"""
+        rows = await self._run(self._query, "SELECT puuid, data FROM players WHERE guild_id = ?", (guild_id,))
+        return {row["puuid"]: json.loads(row["data"]) for row in rows}
+
+    async def upsert_player(self, guild_id: str, puuid: str, player_data: Dict):
+        """プレイヤーを追加または更新"""
+        name = player_data.get("name", "")
+        tag = player_data.get("tag", "")
+        await self._run(
+            self._execute,
+            """
+            INSERT INTO players (guild_id, puuid, name, tag, name_tag, region, discord_user_id, updated_at, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (guild_id, puuid) DO UPDATE SET
+                name = excluded.name, tag = excluded.tag, name_tag = excluded.name_tag,
+                region = excluded.region, discord_user_id = excluded.discord_user_id,
+                updated_at = excluded.updated_at, data = excluded.data
+            """,
+            (
+                guild_id, puuid, name, tag, f"{name}#{tag}".casefold(),
+                player_data.get("region"), player_data.get("discord_user_id"),
+                player_data.get("updated_at"), json.dumps(player_data, ensure_ascii=False)
+            )
+        )
+
+    async def delete_player(self, guild_id: str, puuid: str) -> bool:
+        """プレイヤーを削除"""
+        cursor = await self._run(
+            self._execute, "DELETE FROM players WHERE guild_id = ? AND puuid = ?", (guild_id, puuid)
+        )
+        return cursor.rowcount > 0
+
+    # ---- 自動更新設定 ----
+
+    async def get_auto_update_config(self, guild_id: str) -> Optional[Dict]:
+        """ギルドの自動更新設定を取得"""
+        rows = await self._run(
+            self._query, "SELECT config FROM auto_update_configs WHERE guild_id = ?", (guild_id,)
+        )
+        return json.loads(rows[0]["config"]) if rows else None
+
+    async def set_auto_update_config(self, guild_id: str, config: Dict):
+        """ギルドの自動更新設定を保存"""
+        await self._run(
+            self._execute,
+            """
+            INSERT INTO auto_update_configs (guild_id, enabled, channel_id, message_id, config)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (guild_id) DO UPDATE SET
+                enabled = excluded.enabled, channel_id = excluded.channel_id,
+                message_id = excluded.message_id, config = excluded.config
+            """,
+            (
+                guild_id, 1 if config.get("enabled") else 0, config.get("channel_id"),
+                config.get("message_id"), json.dumps(config, ensure_ascii=False)
+            )
+        )
+
+    async def get_all_auto_update_configs(self) -> Dict[str, Dict]:
+        """すべてのギルドの自動更新設定を取得"""
+        rows = await self._run(self._query, "SELECT guild_id, config FROM auto_update_configs")
+        return {row["guild_id"]: json.loads(row["config"]) for row in rows}
+
+    async def get_enabled_auto_update_configs(self) -> Dict[str, Dict]:
+        """自動更新が有効なギルドの設定だけを取得（enabledの索引を使う）"""
+        rows = await self._run(
+            self._query, "SELECT guild_id, config FROM auto_update_configs WHERE enabled = 1"
+        )
+        return {row["guild_id"]: json.loads(row["config"]) for row in rows}
+
+    # ---- ランクキャッシュ ----
+
+    async def load_rank_entries(self) -> Dict[str, Dict[str, Any]]:
+        """ランクキャッシュの全エントリを読み込む"""
+        rows = await self._run(self._query, "SELECT player_key, entry FROM rank_cache")
+        return {row["player_key"]: json.loads(row["entry"]) for row in rows}
+
+    async def load_rank_entry(self, player_key: str) -> Optional[Dict[str, Any]]:
+        """ランクキャッシュのエントリを1件読み込む（なければNone）"""
+        rows = await self._run(self._query, "SELECT entry FROM rank_cache WHERE player_key = ?", (player_key,))
+        return json.loads(rows[0]["entry"]) if rows else None
+
+    async def save_rank_entries(self, changed: Dict[str, Dict[str, Any]], removed: Iterable[str]):
+        """変更・削除されたランクキャッシュのエントリを保存（変更行のみ書き込む）"""
+        statements = [
+            (
+                "INSERT OR REPLACE INTO rank_cache (player_key, timestamp, entry) VALUES (?, ?, ?)",
+                (player_key, entry.get("timestamp"), json.dumps(entry, ensure_ascii=False))
+            )
+            for player_key, entry in changed.items()
+        ]
+        statements.extend(
+            ("DELETE FROM rank_cache WHERE player_key = ?", (player_key,)) for player_key in removed
+        )
+        if statements:
+            await self._run(self._executemany, statements)
+
+    # ---- 再試行キュー ----
+
+    async def load_retry_entries(self) -> List[Dict]:
+        """全ギルド共通の再試行キューを読み込む"""
+        rows = await self._run(self._query, "SELECT entry FROM retry_queue ORDER BY retry_at")
+        return [json.loads(row["entry"]) for row in rows]
+
+    async def save_retry_entries(self, entries: List[Dict]):
+        """全ギルド共通の再試行キューのスナップショットを保存"""
+        statements = [("DELETE FROM retry_queue", ())]
+        statements.extend(
+            (
+                "INSERT OR REPLACE INTO retry_queue (player_key, retry_at, attempts, entry) VALUES (?, ?, ?, ?)",
+                (_player_key(entry["player"]), entry["retry_at"], entry.get("attempts", 0),
+                 json.dumps(entry, ensure_ascii=False))
+            )
+            for entry in entries
+        )
+        await self._run(self._executemany, statements)
@@ -0,0 +1,136 @@
+import discord
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from ..guild_ranking import GuildRanking
+from ..rank_snapshot import RankSnapshot
+from .ui_helpers import UIHelpers
+
+DISPLAY_LIMIT = 20  # Embedに表示する最大人数
+EMBED_COLOR = 0x8A2BE2  # 紫色
+
+# ランク名の日本語表記
+RANK_NAMES_JP = {
+    "Radiant": "レディアント",
+    "Immortal 3": "イモータル 3",
+    "Immortal 2": "イモータル 2",
+    "Immortal 1": "イモータル 1",
+    "Ascendant 3": "アセンダント 3",
+    "Ascendant 2": "アセンダント 2",
+    "Ascendant 1": "アセンダント 1",
+    "Diamond 3": "ダイヤモンド 3",
+    "Diamond 2": "ダイヤモンド 2",
+    "Diamond 1": "ダイヤモンド 1",
+    "Platinum 3": "プラチナ 3",
+    "Platinum 2": "プラチナ 2",
+    "Platinum 1": "プラチナ 1",
+    "Gold 3": "ゴールド 3",
+    "Gold 2": "ゴールド 2",
+    "Gold 1": "ゴールド 1",
+    "Silver 3": "シルバー 3",
+    "Silver 2": "シルバー 2",
+    "Silver 1": "シルバー 1",
+    "Bronze 3": "ブロンズ 3",
+    "Bronze 2": "ブロンズ 2",
+    "Bronze 1": "ブロンズ 1",
+    "Iron 3": "アイアン 3",
+    "Iron 2": "アイアン 2",
+    "Iron 1": "アイアン 1"
+}
+
+# 上位3名の順位表示
+POSITION_LABELS = {1: "🏅 1位: ", 2: "🥈 2位: ", 3: "🥉 3位: "}
+
+class LeaderboardRenderer:
+    """/leaderboardと自動更新で共有するLeaderboard Embedの描画
+
+    1人分の行はランクの内容と順位ごとに、本文はギルドの順位表のバージョンごとに
+    キャッシュし、順位表が変わっていなければ描画し直さない。
+    """
+
+    def __init__(self, max_lines: int = 5000):
+        self.max_lines = max_lines  # 行キャッシュの最大件数
+        self._lines: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._bodies: Dict[str, Tuple[int, str]] = {}  # guild_id -> (順位表のバージョン, 本文)
+
+        # 統計情報
+        self.stats = {"line_hits": 0, "line_misses": 0, "body_hits": 0, "body_misses": 0}
+
+    def render_line(self, snapshot: RankSnapshot, position: int) -> str:
+        """1人分の行を描画（同じ内容・順位ならキャッシュを返す）"""
+        key = (snapshot.name, snapshot.tag, snapshot.tier_name, snapshot.rr, position)
+        line = self._lines.get(key)
+        if line is not None:
+            self._lines.move_to_end(key)
+            self.stats["line_hits"] += 1
+            return line
+
+        self.stats["line_misses"] += 1
+        rank = snapshot.tier_name
+        label = POSITION_LABELS.get(position, f"{position}位: ")
+        line = (
+            f"{label}**{snapshot.name}#{snapshot.tag}**\n"
+            f"{UIHelpers.get_rank_emoji(rank)} {RANK_NAMES_JP.get(rank, rank)} | {snapshot.rr} RR\n"
+        )
+        self._lines[key] = line
+        if len(self._lines) > self.max_lines:
+            self._lines.popitem(last=False)
+        return line
+
+    def render_body(self, guild_id: str, ranking: GuildRanking) -> str:
+        """順位表の本文を描画（順位表が変わっていなければキャッシュを返す）"""
+        cached = self._bodies.get(guild_id)
+        if cached is not None and cached[0] == ranking.version:
+            self.stats["body_hits"] += 1
+            return cached[1]
+
+        self.stats["body_misses"] += 1
+        lines = [self.render_line(snapshot, i + 1) for i, snapshot in enumerate(ranking.top(DISPLAY_LIMIT))]
+        # プレイヤー間と最下位の下に余白を入れる
+        body = "\n".join(lines) + "\n"
+        if len(ranking) > DISPLAY_LIMIT:
+            body += f"\n🔽 **他 {len(ranking) - DISPLAY_LIMIT} 名のプレイヤー**"
+
+        self._bodies[guild_id] = (ranking.version, body)
+        return body
+
+    def create_embed(self, guild_id: str, ranking: GuildRanking, region: str, total_players: int,
+                     is_auto: bool = False, stale_age: Optional[float] = None, pending: int = 0,
+                     interval_minutes: Optional[float] = None) -> discord.Embed:
+        """かっこいいLeaderboard用のEmbedを作成（interval_minutesは自動更新の間隔）"""
+        embed = discord.Embed(
+            title=UIHelpers.create_leaderboard_title(region, is_auto=is_auto),
+            color=EMBED_COLOR,
+            timestamp=discord.utils.utcnow()
+        )
+
+        if not len(ranking):
+            if pending:
+                embed.description = f"⏳ ランク情報を取得中です…（残り {pending} 名）"
+            elif is_auto:
+                embed.description = "🚫 データを取得できたプレイヤーがいませんでした"
+                if interval_minutes:
+                    embed.description += f"\n🔄 次回更新: {interval_minutes:g}分後"
+            else:
+                embed.description = "🚫 データを取得できたプレイヤーがいませんでした\n💡 API制限またはサーバーエラーの可能性があります"
+            return embed
+
+        embed.description = self.render_body(guild_id, ranking)
+
+        # フッターに詳細情報（日本語）
+        if is_auto:
+            footer_text = f"🔄 自動更新中 • {len(ranking)}/{total_players} 名表示"
+        else:
+            if pending:
+                updated_text = f"⏳ 取得中… 残り {pending} 名"
+            elif stale_age is None:
+                updated_text = "🔄 最終更新: たった今"
+            else:
+                updated_text = f"🕒 {UIHelpers.format_data_age(stale_age)}のデータを含む（更新中…）"
+            footer_text = f"⚡ {len(ranking)}/{total_players} 名表示 • {updated_text}"
+        embed.set_footer(text=footer_text)
+
+        return embed
+
+    def get_stats(self) -> Dict:
+        """描画キャッシュの統計情報を取得"""
+        return {**self.stats, "cached_lines": len(self._lines), "cached_bodies": len(self._bodies)}
@@ -1,111 +1,109 @@
 import discord
 from typing import Dict, Any
+from ..rank_snapshot import TIER_IDS
+
+# カスタム絵文字ID
+CUSTOM_RANK_EMOJIS = {
+    "Radiant": "<:valorantradiant:1309884284760490054>",
+    "Immortal 3": "<:valorantimmortal3:1309884281966956618>",
+    "Immortal 2": "<:valorantimmortal2:1309884246869147749>",
+    "Immortal 1": "<:valorantimmortal1:1309884245447147591>",
+    "Immortal": "<:valorantimmortal3:1309884281966956618>",
+    "Ascendant 3": "<:valorantascendant3:1309884249683525673>",
+    "Ascendant 2": "<:valorantascendant2:1309884292704505887>",
+    "Ascendant 1": "<:valorantascendant1:1309884267148476476>",
+    "Ascendant": "<:valorantascendant3:1309884249683525673>",
+    "Diamond 3": "<:valorantdiamond3:1309884243668762634>",
+    "Diamond 2": "<:valorantdiamond2:1309884256444616885>",
+    "Diamond 1": "<:valorantdiamond1:1309884275193020487>",
+    "Diamond": "<:valorantdiamond3:1309884243668762634>",
+    "Platinum 3": "<:valorantplatinum3:1309884620916920390>",
+    "Platinum 2": "<:valorantplatinum2:1309884251314982922>",
+    "Platinum 1": "<:valorantplatinum1:1309884276690387004>",
+    "Platinum": "<:valorantplatinum3:1309884620916920390>",
+    "Gold 3": "<:valorantgold3:1309884252451508285>",
+    "Gold 2": "<:valorantgold2:1309884238069235803>",
+    "Gold 1": "<:valorantgold1:1309884278192083065>",
+    "Gold": "<:valorantgold3:1309884252451508285>",
+    "Silver 3": "<:valorantsilver3:1309884499751866388>",
+    "Silver 2": "<:valorantsilver2:1309884556874223616>",
+    "Silver 1": "<:valorantsilver1:1309884522351038504>",
+    "Silver": "<:valorantsilver3:1309884499751866388>",
+    "Bronze 3": "<:valorantbronze3:1309884241739382886>",
+    "Bronze 2": "<:valorantbronze2:1309884263461552188>",
+    "Bronze 1": "<:valorantbronze1:1309884259997192192>",
+    "Bronze": "<:valorantbronze3:1309884241739382886>",
+    "Iron 3": "<:valorantiron3:1309884248274112543>",
+    "Iron 2": "<:valorantiron2:1309884288434569236>",
+    "Iron 1": "<:valorantiron1:1309884239369736232>",
+    "Iron": "<:valorantiron3:1309884248274112543>",
+    "Unrated": "<:valorant_unranked:1378116951607345172>"
+}
+
+# フォールバック用の通常絵文字
+FALLBACK_RANK_EMOJIS = {
+    "Radiant": "✨",
+    "Immortal": "💎",
+    "Ascendant": "🌟",
+    "Diamond": "💍",
+    "Platinum": "🔷",
+    "Gold": "🏅",
+    "Silver": "🥈",
+    "Bronze": "🥉",
+    "Iron": "⚡",
+    "Unrated": "❓"
+}
+
+# ランクごとの色
+RANK_COLORS = {
+    "Radiant": 0xFFFFFF,      # 白
+    "Immortal": 0x8A2BE2,     # 紫
+    "Ascendant": 0x00FF7F,    # 緑
+    "Diamond": 0x87CEEB,      # 水色
+    "Platinum": 0x40E0D0,     # ターコイズ
+    "Gold": 0xFFD700,         # 金
+    "Silver": 0xC0C0C0,       # 銀
+    "Bronze": 0xCD7F32,       # 銅
+    "Iron": 0x808080,         # 灰色
+    "Unrated": 0x36393F       # 暗い灰色
+}
+
+# 順位に応じた特別な絵文字
+POSITION_EMOJIS = {
+    1: "👑",    # 王冠
+    2: "🥈",    # 銀メダル
+    3: "🥉",    # 銅メダル
+    4: "🔸",
+    5: "🔹"
+}
 
 class UIHelpers:
     @staticmethod
     def get_rank_icon_url(rank_name: str) -> str:
         """ランクに対応するアイコンURLを取得"""
-        rank_tier_mapping = {
-            "Radiant": 27,
-            "Immortal 3": 26, "Immortal 2": 25, "Immortal 1": 24,
-            "Ascendant 3": 23, "Ascendant 2": 22, "Ascendant 1": 21,
-            "Diamond 3": 20, "Diamond 2": 19, "Diamond 1": 18,
-            "Platinum 3": 17, "Platinum 2": 16, "Platinum 1": 15,
-            "Gold 3": 14, "Gold 2": 13, "Gold 1": 12,
-            "Silver 3": 11, "Silver 2": 10, "Silver 1": 9,
-            "Bronze 3": 8, "Bronze 2": 7, "Bronze 1": 6,
-            "Iron 3": 5, "Iron 2": 4, "Iron 1": 3,
-            "Unrated": 0
-        }
-        
-        tier_id = rank_tier_mapping.get(rank_name, 0)
+        tier_id = TIER_IDS.get(rank_name, 0)
         return f"https://media.valorant-api.com/competitivetiers/03621f52-342b-cf4e-4f86-9350a49c6d04/{tier_id}/smallicon.png"
     
     @staticmethod
     def get_rank_emoji(rank_name: str) -> str:
         """ランクに対応する絵文字を取得"""
-        # カスタム絵文字ID
-        custom_rank_emojis = {
-            "Radiant": "<:valorantradiant:1309884284760490054>",
-            "Immortal 3": "<:valorantimmortal3:1309884281966956618>",
-            "Immortal 2": "<:valorantimmortal2:1309884246869147749>",
-            "Immortal 1": "<:valorantimmortal1:1309884245447147591>",
-            "Immortal": "<:valorantimmortal3:1309884281966956618>",
-            "Ascendant 3": "<:valorantascendant3:1309884249683525673>",
-            "Ascendant 2": "<:valorantascendant2:1309884292704505887>",
-            "Ascendant 1": "<:valorantascendant1:1309884267148476476>",
-            "Ascendant": "<:valorantascendant3:1309884249683525673>",
-            "Diamond 3": "<:valorantdiamond3:1309884243668762634>",
-            "Diamond 2": "<:valorantdiamond2:1309884256444616885>",
-            "Diamond 1": "<:valorantdiamond1:1309884275193020487>",
-            "Diamond": "<:valorantdiamond3:1309884243668762634>",
-            "Platinum 3": "<:valorantplatinum3:1309884620916920390>",
-            "Platinum 2": "<:valorantplatinum2:1309884251314982922>",
-            "Platinum 1": "<:valorantplatinum1:1309884276690387004>",
-            "Platinum": "<:valorantplatinum3:1309884620916920390>",
-            "Gold 3": "<:valorantgold3:1309884252451508285>",
-            "Gold 2": "<:valorantgold2:1309884238069235803>",
-            "Gold 1": "<:valorantgold1:1309884278192083065>",
-            "Gold": "<:valorantgold3:1309884252451508285>",
-            "Silver 3": "<:valorantsilver3:1309884499751866388>",
-            "Silver 2": "<:valorantsilver2:1309884556874223616>",
-            "Silver 1": "<:valorantsilver1:1309884522351038504>",
-            "Silver": "<:valorantsilver3:1309884499751866388>",
-            "Bronze 3": "<:valorantbronze3:1309884241739382886>",
-            "Bronze 2": "<:valorantbronze2:1309884263461552188>",
-            "Bronze 1": "<:valorantbronze1:1309884259997192192>",
-            "Bronze": "<:valorantbronze3:1309884241739382886>",
-            "Iron 3": "<:valorantiron3:1309884248274112543>",
-            "Iron 2": "<:valorantiron2:1309884288434569236>",
-            "Iron 1": "<:valorantiron1:1309884239369736232>",
-            "Iron": "<:valorantiron3:1309884248274112543>",
-            "Unrated": "<:valorant_unranked:1378116951607345172>"
-        }
-        
-        # フォールバック用の通常絵文字
-        fallback_emojis = {
-            "Radiant": "✨",
-            "Immortal": "💎",
-            "Ascendant": "🌟",
-            "Diamond": "💍",
-            "Platinum": "🔷",
-            "Gold": "🏅",
-            "Silver": "🥈",
-            "Bronze": "🥉",
-            "Iron": "⚡",
-            "Unrated": "❓"
-        }
-        
         # まず完全一致を試す（例: "Immortal 3"）
-        if rank_name in custom_rank_emojis:
-            return custom_rank_emojis[rank_name]
+        if rank_name in CUSTOM_RANK_EMOJIS:
+            return CUSTOM_RANK_EMOJIS[rank_name]
         
         # 完全一致がない場合、ランク名の最初の単語で試す（例: "Immortal"）
         rank_base = rank_name.split()[0] if rank_name and " " in rank_name else rank_name
-        if rank_base in custom_rank_emojis:
-            return custom_rank_emojis[rank_base]
+        if rank_base in CUSTOM_RANK_EMOJIS:
+            return CUSTOM_RANK_EMOJIS[rank_base]
         
         # フォールバック
-        return fallback_emojis.get(rank_base, "❓")
+        return FALLBACK_RANK_EMOJIS.get(rank_base, "❓")
     
     @staticmethod
     def get_rank_color(rank_name: str) -> int:
         """ランクに対応する色を取得"""
-        rank_colors = {
-            "Radiant": 0xFFFFFF,      # 白
-            "Immortal": 0x8A2BE2,     # 紫
-            "Ascendant": 0x00FF7F,    # 緑
-            "Diamond": 0x87CEEB,      # 水色
-            "Platinum": 0x40E0D0,     # ターコイズ
-            "Gold": 0xFFD700,         # 金
-            "Silver": 0xC0C0C0,       # 銀
-            "Bronze": 0xCD7F32,       # 銅
-            "Iron": 0x808080,         # 灰色
-            "Unrated": 0x36393F       # 暗い灰色
-        }
-        
         rank_base = rank_name.split()[0] if rank_name and " " in rank_name else rank_name
-        return rank_colors.get(rank_base, 0xFA4454)  # デフォルト（Valorant赤）
+        return RANK_COLORS.get(rank_base, 0xFA4454)  # デフォルト（Valorant赤）
     
     @staticmethod
     def create_progress_bar(current_rr: int, max_rr: int = 100, length: int = 10) -> str:
@@ -144,16 +142,9 @@ class UIHelpers:
     @staticmethod
     def get_position_emoji(position: int) -> str:
         """順位に応じた特別な絵文字を取得"""
-        position_emojis = {
-            1: "👑",    # 王冠
-            2: "🥈",    # 銀メダル
-            3: "🥉",    # 銅メダル
-            4: "🔸",
-            5: "🔹"
-        }
         
         if position <= 5:
-            return position_emojis.get(position, "🔸")
+            return POSITION_EMOJIS.get(position, "🔸")
         elif position <= 10:
             return "⭐"
         else:
@@ -173,6 +164,16 @@ class UIHelpers:
             return f"{rank_emoji} **{rank_name}**\n`{progress}`"
     
     
+    @staticmethod
+    def format_data_age(age_seconds: float) -> str:
+        """データの経過時間を表示用にフォーマット"""
+        minutes = int(age_seconds // 60)
+        if minutes < 1:
+            return "たった今"
+        if minutes < 60:
+            return f"{minutes}分前"
+        return f"{minutes // 60}時間前"
+    
     @staticmethod
     def create_leaderboard_title(region: str, is_auto: bool = False) -> str:
         """リーダーボードのタイトルを作成"""
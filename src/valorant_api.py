@@ -1,158 +1,336 @@
+import os
 import aiohttp
 import asyncio
-from typing import List, Dict, Optional, Tuple
+import time
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from urllib.parse import quote
 from .rank_cache import RankCache
+from .rank_snapshot import RankSnapshot
+from .guild_ranking import GuildRanking, RankingIndex
+from .http_session import create_http_session, get_host_connection_limit
+from .rate_limiter import RateLimiter, Priority
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .adaptive_limiter import AdaptiveConcurrencyLimiter
+from .metrics import Histogram
 
 class ValorantAPI:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, session: Optional[aiohttp.ClientSession] = None,
+                 rate_limiter: Optional[RateLimiter] = None, cache: Optional[RankCache] = None):
         self.api_key = api_key
         self.base_url = "https://api.henrikdev.xyz/valorant"
         self.headers = {"Authorization": api_key}
-        self.cache = RankCache()
+        self.cache = cache or RankCache()
+        # ギルドごとの順位表（キャッシュの更新を差分で反映する）
+        self.rankings = RankingIndex()
+        self.cache.add_listener(self.rankings.on_player_updated)
+        self.session = session  # Botから共有されるHTTPセッション
+        self._owns_session = False
+        # プロセス全体で共有するレート制限スケジューラ
+        self.rate_limiter = rate_limiter or RateLimiter(
+            int(os.getenv('VALORANT_API_RATE_LIMIT', '30')),
+            reserved_tokens=int(os.getenv('VALORANT_API_RESERVED_TOKENS', '1')),
+            aging_seconds=float(os.getenv('VALORANT_API_PRIORITY_AGING_SECONDS', '15'))
+        )
+        self.max_rate_limit_retries = int(os.getenv('VALORANT_API_MAX_429_RETRIES', '3'))
+        # 同一プレイヤーへの同時リクエストを1本にまとめるための実行中マップ
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self._inflight_priority: Dict[Tuple, int] = {}  # 実行中リクエストの優先度（相乗りで引き上げる）
+        self.request_count = 0  # 実際に送信したリクエスト数
+        self.coalesced_count = 0  # 実行中リクエストに相乗りした回数
+        self.request_latency = Histogram()  # エンドポイント・ステータスごとのレイテンシ
+        # リーダーボード・一括更新の同時実行数（APIの応答状況に合わせてプロセス全体で調整）
+        # 接続プールより広げても接続待ちになるだけなので、上限はプールの接続数までにする
+        max_concurrency = int(os.getenv('VALORANT_API_CONCURRENCY_MAX', '10'))
+        pool_limit = get_host_connection_limit()
+        self.concurrency = AdaptiveConcurrencyLimiter(
+            initial=int(os.getenv('VALORANT_API_CONCURRENCY_INITIAL', '3')),
+            min_limit=int(os.getenv('VALORANT_API_CONCURRENCY_MIN', '1')),
+            max_limit=min(max_concurrency, pool_limit) if pool_limit else max_concurrency
+        )
+        # 5xx・タイムアウトが続いたらAPIへのリクエストを止める
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5')),
+            recovery_timeout=float(os.getenv('CIRCUIT_BREAKER_RECOVERY_TIMEOUT', '30'))
+        )
     
-    async def get_account(self, name: str, tag: str) -> Dict:
-        """アカウント情報をRiot IDで取得"""
-        url = f"{self.base_url}/v2/account/{quote(name)}/{quote(tag)}"
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 404:
-                    raise ValueError(f"プレイヤー {name}#{tag} が見つかりませんでした")
-                elif response.status == 429:
-                    raise RuntimeError("API制限に達しました")
-                else:
-                    raise RuntimeError(f"APIエラー: {response.status}")
-    
-    async def get_player_rank(self, region: str, name: str, tag: str, season: Optional[str] = None) -> Dict:
-        """プレイヤーの競合ランク情報を取得"""
-        url = f"{self.base_url}/v3/mmr/{region}/pc/{quote(name)}/{quote(tag)}"
-        params = {"season": season} if season else {}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=self.headers, params=params) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 404:
-                    raise ValueError(f"プレイヤー {name}#{tag} のランク情報が見つかりませんでした")
-                elif response.status == 429:
-                    raise RuntimeError("API制限に達しました")
-                else:
-                    raise RuntimeError(f"APIエラー: {response.status}")
-    
-    async def get_leaderboard_data(self, region: str, players: List[Dict[str, str]], guild_id: str = None) -> Tuple[List[Dict], List[Dict]]:
-        """複数プレイヤーのランク情報を一括取得（キャッシュ付き）
-        Returns: (成功したデータのリスト, 失敗したプレイヤーのリスト)
+    def _get_session(self) -> aiohttp.ClientSession:
+        """共有セッションを取得（未指定の場合は自前で作成）"""
+        if self.session is None or self.session.closed:
+            self.session = create_http_session()
+            self._owns_session = True
+        return self.session
+    
+    async def close(self):
+        """自前で作成したセッションを閉じる"""
+        if self._owns_session and self.session and not self.session.closed:
+            await self.session.close()
+    
+    async def _request(self, url: str, not_found_message: str, params: Optional[Dict] = None,
+                       key: Optional[Tuple] = None, priority: int = Priority.BACKGROUND) -> Dict:
+        """レート制限スケジューラを通してAPIにリクエストを送信
+        429の場合は失敗させずに待機してから再送する（相乗りで引き上げられた優先度で並び直す）
+        サーキットブレーカーが開いている間は送信せずにCircuitOpenErrorを送出する
         """
-        success_results = []
-        failed_players = []
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("API障害のためリクエストを一時停止しています")
         
-        async def get_single_player(player):
-            player_key = f"{player['name']}#{player['tag']}"
-            
-            # キャッシュから取得を試みる
-            if guild_id:
-                cached_data = await self.cache.get_player_data(guild_id, player_key)
-                if cached_data:
-                    print(f"Using cached data for {player_key}")
-                    return cached_data, False  # (data, is_from_api)
-            
-            # APIから取得
+        session = self._get_session()
+        endpoint = key[0] if key else "other"
+        for attempt in range(self.max_rate_limit_retries + 1):
+            await self.rate_limiter.acquire(self._inflight_priority.get(key, priority), tag=key)
+            started_at = time.monotonic()
             try:
-                rank_data = await self.get_player_rank(region, player["name"], player["tag"])
-                result = {
-                    "name": player["name"],
-                    "tag": player["tag"],
-                    **rank_data["data"]
-                }
-                
-                # キャッシュに保存
-                if guild_id:
-                    await self.cache.update_player_data(guild_id, player_key, result)
-                
-                return result, True  # (data, is_from_api)
-            except Exception as e:
-                print(f"Failed to get rank for {player_key}: {e}")
-                
-                # API制限エラーの場合、キャッシュから古いデータを使用
-                if guild_id and "API制限" in str(e):
-                    cached_data = await self.cache.get_player_data(guild_id, player_key)
-                    if cached_data:
-                        print(f"Using stale cached data for {player_key} due to API limit")
-                        await self.cache.mark_update_failed(guild_id, player_key)
-                        return cached_data, False
+                async with session.get(url, headers=self.headers, params=params or {}) as response:
+                    self.request_latency.observe(time.monotonic() - started_at, endpoint=endpoint, status=str(response.status))
+                    self.rate_limiter.update_from_headers(response.status, response.headers)
+                    if response.status >= 500:
+                        self.circuit_breaker.record_failure()
+                        self.concurrency.record_failure()
+                        raise RuntimeError(f"APIエラー: {response.status}")
+                    self.circuit_breaker.record_success()
+                    if response.status == 429:
+                        self.concurrency.record_failure()
+                    else:
+                        self.concurrency.record_success(time.monotonic() - started_at)
                     
-                    # キャッシュもない場合、全キャッシュから取得を試みる
-                    all_cache = await self.cache.get_all_cached_data(guild_id)
-                    if player_key in all_cache:
-                        print(f"Using old cached data for {player_key}")
-                        return all_cache[player_key], False
-                
-                return None, False
-        
-        # API制限を考慮して並列実行数を制限
-        semaphore = asyncio.Semaphore(3)  # 同時実行数3に制限
+                    if response.status == 200:
+                        return await response.json()
+                    elif response.status == 404:
+                        raise ValueError(not_found_message)
+                    elif response.status == 429:
+                        if attempt < self.max_rate_limit_retries:
+                            print(f"Rate limited, waiting before retry ({attempt + 1}/{self.max_rate_limit_retries})")
+                            continue
+                        raise RuntimeError("API制限に達しました")
+                    else:
+                        raise RuntimeError(f"APIエラー: {response.status}")
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # 接続できない・応答がない場合もAPI障害として数える
+                status = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+                self.request_latency.observe(time.monotonic() - started_at, endpoint=endpoint, status=status)
+                self.circuit_breaker.record_failure()
+                self.concurrency.record_failure()
+                raise
+    
+    async def _single_flight(self, key: Tuple, url: str, not_found_message: str, params: Optional[Dict] = None,
+                             priority: int = Priority.BACKGROUND) -> Dict:
+        """同じキーのリクエストが実行中ならその結果を共有する
+        より優先度の高い呼び出しが相乗りした場合は、実行中リクエストの優先度を引き上げる
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced_count += 1
+            if priority < self._inflight_priority.get(key, priority):
+                self._inflight_priority[key] = priority
+                self.rate_limiter.raise_priority(key, priority)
+            return await asyncio.shield(task)
         
-        async def bounded_request(player):
-            async with semaphore:
-                return await get_single_player(player)
+        self.request_count += 1
+        self._inflight_priority[key] = priority
+        task = asyncio.ensure_future(self._request(url, not_found_message, params, key, priority))
+        self._inflight[key] = task
         
-        tasks = [bounded_request(player) for player in players]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        def _on_done(done_task: asyncio.Task):
+            self._inflight.pop(key, None)
+            self._inflight_priority.pop(key, None)
+            # 待機者が全員キャンセルされても例外が未回収にならないようにする
+            if not done_task.cancelled():
+                done_task.exception()
         
-        # 結果を分類
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                failed_players.append(players[i])
-            elif result is not None:
-                data, is_from_api = result
-                if data is not None:
-                    success_results.append(data)
-                else:
-                    failed_players.append(players[i])
-                    if guild_id:
-                        # 再試行キューに追加
-                        await self.cache.add_to_retry_queue(guild_id, players[i])
+        task.add_done_callback(_on_done)
+        # 呼び出し元がキャンセルされても他の待機者のためにリクエストは継続する
+        return await asyncio.shield(task)
+    
+    async def get_account(self, name: str, tag: str, priority: int = Priority.INTERACTIVE) -> Dict:
+        """アカウント情報をRiot IDで取得"""
+        url = f"{self.base_url}/v2/account/{quote(name)}/{quote(tag)}"
+        key = ("account", name.lower(), tag.lower())
+        return await self._single_flight(key, url, f"プレイヤー {name}#{tag} が見つかりませんでした", priority=priority)
+    
+    async def get_player_rank(self, region: str, name: str, tag: str, season: Optional[str] = None,
+                              priority: int = Priority.INTERACTIVE) -> Dict:
+        """プレイヤーの競合ランク情報を取得"""
+        url = f"{self.base_url}/v3/mmr/{region}/pc/{quote(name)}/{quote(tag)}"
+        params = {"season": season} if season else {}
+        key = ("mmr", region, name.lower(), tag.lower(), season)
+        return await self._single_flight(key, url, f"プレイヤー {name}#{tag} のランク情報が見つかりませんでした", params,
+                                         priority)
+    
+    async def get_player_rank_by_puuid(self, region: str, puuid: str, season: Optional[str] = None,
+                                       priority: int = Priority.BACKGROUND) -> Dict:
+        """puuidでプレイヤーの競合ランク情報を取得（名前変更の影響を受けない）"""
+        url = f"{self.base_url}/v3/by-puuid/mmr/{region}/pc/{quote(puuid)}"
+        params = {"season": season} if season else {}
+        key = ("mmr-puuid", region, puuid, season)
+        return await self._single_flight(key, url, f"puuid {puuid} のランク情報が見つかりませんでした", params,
+                                         priority)
+    
+    async def fetch_player_rank(self, player: Dict, region: str, priority: int = Priority.BACKGROUND) -> RankSnapshot:
+        """登録プレイヤーのランク情報を取得してリーダーボード用のデータにする
+        puuidがあれば名前変更の影響を受けないpuuidで取得する
+        見つからなかったプレイヤーは一定時間APIに問い合わせずにValueErrorを送出する
+        """
+        player_key = self.cache.player_key(player)
+        if self.cache.is_not_found(player_key):
+            raise ValueError(f"プレイヤー {player['name']}#{player['tag']} が見つかりませんでした")
         
-        return success_results, failed_players
-    
-    def sort_by_rank(self, players_data: List[Dict]) -> List[Dict]:
-        """ランクでプレイヤーをソート（高いランクから低いランクへ）"""
-        rank_order = {
-            "Radiant": 8,
-            "Immortal": 7, 
-            "Ascendant": 6,
-            "Diamond": 5,
-            "Platinum": 4,
-            "Gold": 3,
-            "Silver": 2,
-            "Bronze": 1,
-            "Iron": 0,
-            "Unrated": -1
+        try:
+            if player.get("puuid"):
+                rank_data = await self.get_player_rank_by_puuid(region, player["puuid"], priority=priority)
+            else:
+                rank_data = await self.get_player_rank(region, player["name"], player["tag"], priority=priority)
+        except ValueError:
+            self.cache.mark_not_found(player_key)
+            raise
+        return RankSnapshot.from_api(player["name"], player["tag"], region, rank_data["data"])
+    
+    def get_request_stats(self) -> Dict:
+        """リクエストの統計情報を取得"""
+        return {
+            "requests": self.request_count,
+            "coalesced": self.coalesced_count,
+            "in_flight": len(self._inflight),
+            "circuit": self.circuit_breaker.get_stats(),
+            "concurrency": self.concurrency.get_stats()
         }
-        
-        def get_rank_value(player):
-            current = player.get("current", {})
-            tier = current.get("tier", {})
-            current_tier = tier.get("name", "Unrated")
+    
+    async def _get_cached_player_data(self, player: Dict, revalidate: Optional[List[Dict]]) -> Optional[RankSnapshot]:
+        """キャッシュからリーダーボード用のデータを取得（使えるデータがなければNone）"""
+        cached = await self.cache.get_player_entry(self.cache.player_key(player))
+        if cached is None:
+            return None
+        cached_data, age, fresh = cached
+        if fresh:
+            print(f"Using cached data for {player['name']}#{player['tag']}")
+            return cached_data
+        if revalidate is not None and self.cache.can_serve_stale(age):
+            # 古いデータを先に返し、更新は呼び出し側に任せる
+            revalidate.append(player)
+            return cached_data
+        return None
+    
+    async def _fetch_player_data(self, player: Dict, region: str,
+                                 priority: int = Priority.LEADERBOARD) -> Tuple[Optional[RankSnapshot], bool]:
+        """APIからリーダーボード用のデータを取得してキャッシュを更新
+        Returns: (データ（失敗時はNone）, APIから取得したか)
+        """
+        player_key = self.cache.player_key(player)
+        player_label = f"{player['name']}#{player['tag']}"
+        try:
+            result = await self.fetch_player_rank(player, region, priority)
             
-            if current_tier == "Unrated":
-                return (-1, 0, 0)
+            # キャッシュに保存
+            await self.cache.update_player_data(player_key, result)
             
-            # ランク名の最初の部分を取得 (例: "Immortal 3" -> "Immortal")
-            rank_name = current_tier.split()[0] if " " in current_tier else current_tier
-            rank_value = rank_order.get(rank_name, -2)
+            return result, True
+        except Exception as e:
+            print(f"Failed to get rank for {player_label}: {e}")
             
-            # 同じランク種類内でのティア番号を取得 (例: "Ascendant 2" -> 2)
-            tier_number = 0
-            if " " in current_tier:
-                try:
-                    tier_number = int(current_tier.split()[1])
-                except (ValueError, IndexError):
-                    tier_number = 0
+            # 見つからない場合以外（API制限・API障害など）はキャッシュから古いデータを使用
+            if not isinstance(e, ValueError):
+                cached = await self.cache.get_player_entry(player_key)
+                if cached is not None:
+                    print(f"Using stale cached data for {player_label} due to API error")
+                    await self.cache.mark_update_failed(player_key)
+                    return cached[0], False
             
-            # 同じランク内でのRRでソート
-            rr = current.get("rr", 0)
-            return (rank_value, tier_number, rr)
+            return None, False
+    
+    async def get_cached_leaderboard_data(self, players: List[Dict[str, str]],
+                                          revalidate: Optional[List[Dict]] = None) -> Tuple[List[Optional[RankSnapshot]], List[int]]:
+        """キャッシュだけでリーダーボード用のデータを集める（APIには問い合わせない）
+        Returns: (playersと同じ順のデータ（キャッシュになければNone）, APIから取得が必要なインデックス)
+        """
+        results: List[Optional[RankSnapshot]] = []
+        pending = []
+        for i, player in enumerate(players):
+            data = await self._get_cached_player_data(player, revalidate)
+            results.append(data)
+            if data is None:
+                pending.append(i)
+        return results, pending
+    
+    async def iter_leaderboard_data(self, region: str, players: List[Dict[str, str]], indexes: List[int],
+                                    priority: int = Priority.LEADERBOARD) -> AsyncIterator[Tuple[int, Optional[RankSnapshot]]]:
+        """指定したプレイヤーのランク情報をAPIから取得し、完了した順に返す
+        各プレイヤーは登録時の地域で取得し、regionは地域が未登録のプレイヤーに使う
+        Yields: (playersのインデックス, データ（失敗時はNone）)
+        """
+        async def fetch(i):
+            # APIの応答状況に合わせて並列実行数を制限
+            player_region = players[i].get("region") or region
+            async with self.concurrency.slot(priority):
+                data, _ = await self._fetch_player_data(players[i], player_region, priority)
+                return i, data
+        
+        tasks = [asyncio.ensure_future(fetch(i)) for i in indexes]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # 途中で打ち切られた場合は残りの取得を止める
+            for task in tasks:
+                task.cancel()
+    
+    async def get_guild_ranking(self, guild_id: str, region: str, players: List[Dict[str, str]],
+                                revalidate: Optional[List[Dict]] = None,
+                                priority: int = Priority.LEADERBOARD) -> Tuple[GuildRanking, List[Dict]]:
+        """ギルドのランク情報を取得して順位表に反映（変わったプレイヤーだけ並べ替える）
+        Returns: (ギルドの順位表, 失敗したプレイヤーのリスト)
+        """
+        player_keys = [self.cache.player_key(player) for player in players]
+        results, pending = await self.get_cached_leaderboard_data(players, revalidate)
+        async for i, data in self.iter_leaderboard_data(region, players, pending, priority):
+            results[i] = data
+        
+        ranking = self.rankings.sync_guild(guild_id, player_keys, {
+            player_key: data for player_key, data in zip(player_keys, results) if data is not None
+        })
+        failed_players = [player for player, data in zip(players, results) if data is None]
+        return ranking, failed_players
+    
+    async def refresh_players(self, players: List[Dict], region: str,
+                              priority: int = Priority.BACKGROUND) -> List[Dict]:
+        """プレイヤーのランク情報を取得し直してキャッシュを更新（バックグラウンド更新用）
+        Returns: 更新に失敗したプレイヤーのリスト
+        """
+        async def refresh(player):
+            player_region = player.get("region") or region
+            async with self.concurrency.slot(priority):
+                result = await self.fetch_player_rank(player, player_region, priority)
+            await self.cache.update_player_data(self.cache.player_key(player), result)
+        
+        results = await asyncio.gather(*(refresh(player) for player in players), return_exceptions=True)
+        failed_players = []
+        for player, result in zip(players, results):
+            if isinstance(result, Exception):
+                print(f"Failed to refresh rank for {player['name']}#{player['tag']}: {result}")
+                await self.cache.mark_update_failed(self.cache.player_key(player))
+                failed_players.append(player)
+        return failed_players
+    
+    async def get_cached_player_rank(self, region: str, name: str, tag: str) -> Optional[Tuple[RankSnapshot, float, bool]]:
+        """/rank用にキャッシュ済みのランク情報・経過秒数・TTL内かを取得（ハードTTL切れ・別地域のデータは使わない）"""
+        player_key = await self.cache.find_player_key(name, tag)
+        if player_key is None:
+            return None
+        cached = await self.cache.get_player_entry(player_key)
+        if cached is None or not self.cache.can_serve_stale(cached[1]):
+            return None
+        if cached[0].region not in (None, region):
+            return None
+        return cached
+    
+    async def refresh_player_rank(self, region: str, name: str, tag: str,
+                                  priority: int = Priority.INTERACTIVE) -> RankSnapshot:
+        """Riot IDでランク情報を取得してキャッシュを更新（/rank用）"""
+        rank_data = await self.get_player_rank(region, name, tag, priority=priority)
+        data = rank_data.get("data")
+        if not data:
+            raise ValueError(f"プレイヤー {name}#{tag} のランク情報が見つかりませんでした")
         
-        return sorted(players_data, key=get_rank_value, reverse=True)
\ No newline at end of file
+        result = RankSnapshot.from_api(name, tag, region, data)
+        # 登録済みプレイヤーと同じキー（puuid）でキャッシュを共有する
+        player_key = result.puuid or await self.cache.find_player_key(name, tag) or self.cache.riot_id_key(name, tag)
+        await self.cache.update_player_data(player_key, result)
+        return result
@@ -0,0 +1,53 @@
+import asyncio
+import tempfile
+import unittest
+from src.rank_cache import RankCache
+from src.rank_snapshot import RankSnapshot
+from src.storage.json_storage import JsonStorage
+
+def _snapshot(name: str, rr: int) -> RankSnapshot:
+    return RankSnapshot(name=name, tag="jp1", puuid=name, region="ap", tier=20, tier_name="Diamond 3", rr=rr,
+                        peak_tier=20, peak_tier_name="Diamond 3", peak_rr=rr, leaderboard_rank=None,
+                        fetched_at=None)
+
+class RankCacheEvictionTest(unittest.TestCase):
+    def test_evicted_entries_stay_in_storage_and_reload_on_miss(self):
+        """LRUで追い出したエントリは保存先に残り、次に参照したときに読み直される"""
+        async def scenario(tmpdir: str):
+            cache = RankCache(JsonStorage(tmpdir))
+            cache.max_entries = 2
+            for i, name in enumerate(["a", "b", "c"]):
+                await cache.update_player_data(name, _snapshot(name, i))
+            self.assertEqual(cache.get_stats()["evictions"], 1)
+            await cache.close()
+
+            # 追い出された"a"も保存先には残っている
+            self.assertIn("a", await JsonStorage(tmpdir).load_rank_entries())
+
+            entry = await cache.get_player_entry("a")
+            self.assertIsNotNone(entry)
+            self.assertEqual(entry[0].rr, 0)
+            self.assertEqual(cache.get_stats()["reloads"], 1)
+            self.assertEqual(await cache.find_player_key("B", "JP1"), "b")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            asyncio.run(scenario(tmpdir))
+
+    def test_unsaved_changes_survive_eviction(self):
+        """保存前に追い出されたエントリの変更も書き込まれる"""
+        async def scenario(tmpdir: str):
+            cache = RankCache(JsonStorage(tmpdir))
+            cache.max_entries = 1
+            await cache.update_player_data("a", _snapshot("a", 10))
+            await cache.update_player_data("b", _snapshot("b", 20))  # 書き込み前に"a"を追い出す
+            await cache.close()
+
+            stored = await JsonStorage(tmpdir).load_rank_entries()
+            self.assertEqual(sorted(stored), ["a", "b"])
+            self.assertEqual(stored["a"]["data"]["rr"], 10)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            asyncio.run(scenario(tmpdir))
+
+if __name__ == "__main__":
+    unittest.main()
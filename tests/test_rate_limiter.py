@@ -0,0 +1,94 @@
+import asyncio
+import tempfile
+import unittest
+from src.rank_cache import RankCache
+from src.rate_limiter import RateLimiter, Priority
+from src.storage.json_storage import JsonStorage
+from src.valorant_api import ValorantAPI
+
+class RateLimiterCancelTest(unittest.TestCase):
+    def test_acquire_after_cancelled_waiter(self):
+        """キャンセル直後（待機者がまだ残っている間）に別のacquireが来てもトークンを受け取れる"""
+        async def scenario():
+            limiter = RateLimiter(60, safety_margin=1.0, burst=1, reserved_tokens=0)
+            await limiter.acquire(Priority.INTERACTIVE)  # バケットを空にする
+
+            waiting = asyncio.ensure_future(limiter.acquire(Priority.INTERACTIVE))
+            await asyncio.sleep(0)  # 待機列に入れる
+            waiting.cancel()
+            # キャンセルされたタスクが再開する前にトークンが補充され、次のacquireが来る
+            limiter.tokens = 1.0
+            limiter.updated_at = float("inf")
+            await limiter.acquire(Priority.INTERACTIVE)
+
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual(limiter.get_stats()["waiting"], 0)
+
+        asyncio.run(scenario())
+
+class _FakeResponse:
+    """送信順を記録するだけのAPIレスポンス"""
+
+    status = 200
+    headers = {}
+
+    def __init__(self, sent: list, url: str):
+        self.sent = sent
+        self.puuid = url.rsplit("/", 1)[1]
+
+    async def __aenter__(self):
+        self.sent.append(self.puuid)
+        await asyncio.sleep(0.01)
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def json(self):
+        return {"data": {"account": {"puuid": self.puuid}, "current": {"tier": {"id": 10, "name": "Silver 2"}, "rr": 5}}}
+
+class _FakeSession:
+    closed = False
+
+    def __init__(self):
+        self.sent = []
+
+    def get(self, url, **kwargs):
+        return _FakeResponse(self.sent, url)
+
+class ValorantAPIPriorityTest(unittest.TestCase):
+    def test_leaderboard_fetch_overtakes_queued_background_fetches(self):
+        """同時実行数の枠とレート制限の両方を通しても、リーダーボードの取得が自動更新・再試行より先に送られる"""
+        async def scenario():
+            with tempfile.TemporaryDirectory() as data_dir:
+                session = _FakeSession()
+                api = ValorantAPI(
+                    "key", session=session,
+                    rate_limiter=RateLimiter(600, safety_margin=1.0, burst=1, reserved_tokens=0),
+                    cache=RankCache(JsonStorage(data_dir))
+                )
+                api.concurrency.window = api.concurrency.max_limit = 2
+
+                def players(name, count):
+                    return [{"name": name, "tag": "T", "puuid": f"{name}{i}", "region": "ap"} for i in range(count)]
+
+                background = [
+                    asyncio.ensure_future(api.refresh_players(players("auto", 8), "ap", Priority.AUTO_UPDATE)),
+                    asyncio.ensure_future(api.refresh_players(players("retry", 8), "ap", Priority.BACKGROUND)),
+                ]
+                await asyncio.sleep(0.05)  # バックグラウンドの取得を待機列に並べる
+                queued_at = len(session.sent)
+
+                leaderboard = [data async for data in api.iter_leaderboard_data("ap", players("lb", 1), [0])]
+                await asyncio.gather(*background)
+                await api.cache.close()
+
+                self.assertIsNotNone(leaderboard[0][1])
+                # 送信中の枠（2つ）が空き次第、待機中のどのバックグラウンド取得よりも先に送られる
+                self.assertLessEqual(session.sent.index("lb0") - queued_at, 2)
+
+        asyncio.run(scenario())
+
+if __name__ == "__main__":
+    unittest.main()